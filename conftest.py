@@ -0,0 +1,4 @@
+"""
+Root pytest configuration
+Anchors the rootdir so tests import core/ and integration/ via pyproject pythonpath
+"""
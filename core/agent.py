@@ -3,61 +3,36 @@ Core Agent Implementation
 Implements reasoning, planning, tool usage, and reflection
 """
 import os
+import re
+import json
+import asyncio
 import logging
-from typing import List
-from openai import OpenAI
+from typing import AsyncIterator, List, Optional, Tuple
+from collections import defaultdict
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
 from core.memory import MemoryManager
-from core.tools import ToolManager
+from core.tools import get_tool_manager
 from core.planner import Planner
+from core.cache import LLMCache
+from core.dispatcher import BatchDispatcher
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 
 
 logger = logging.getLogger(__name__)
 
-class GardenAdvisorAgent:
-    """Main LLM Agent with reasoning, planning, and reflection capabilities"""
-    
-    def __init__(self):
-        # Initialize Groq client (compatible with OpenAI API)
-        self.client = OpenAI(
-            api_key=os.getenv('GROQ_API_KEY'),
-            base_url=os.getenv('GROQ_API_BASE', 'https://api.groq.com/openai/v1')
-        )
-        self.model = os.getenv('GROQ_MODEL', 'mixtral-8x7b-32768')
-        
-        self.memory_manager = MemoryManager()
-        self.tool_manager = ToolManager()
-        self.planner = Planner()
-        
-        logger.info("Garden Advisor Agent initialized")
-    
-    def llm(self, messages):
-        """Wrapper for LLM chat completions"""
-        try:
-            formatted_messages = [
-                {"role": "system" if isinstance(m, SystemMessage) else
-                        "user" if isinstance(m, HumanMessage) else
-                        "assistant", "content": m.content}
-                for m in messages
-            ]
-            
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=formatted_messages,
-                temperature=0.7
-            )
-            
-            return AIMessage(content=completion.choices[0].message.content)
-        except Exception as e:
-            logger.error(f"LLM request failed: {e}", exc_info=True)
-            return AIMessage(content="Sorry, I'm having trouble connecting to the LLM right now.")
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
 
-    def _create_system_prompt(self) -> str:
-        """Create system prompt with ReAct framework"""
-        tools_description = self.tool_manager.get_tools_description()
-        
-        return f"""You are a Smart Garden Advisor Agent helping users with plant care.
+# ReAct markers, matched in a single pass over the LLM output
+_ACTION_RE = re.compile(r'^\s*Action:\s*([^:\n]+):\s*(.+)$', re.MULTILINE)
+_ANSWER_RE = re.compile(r'Answer:\s*(.*)', re.DOTALL)
+
+_SYSTEM_PROMPT_TEMPLATE = """You are a Smart Garden Advisor Agent helping users with plant care.
 
     You use the ReAct (Reasoning + Acting) framework:
     1. Thought: Think about what you need to do
@@ -81,28 +56,25 @@ class GardenAdvisorAgent:
     Observation: [result analysis]
     Answer: [final response to user]
     """
-    
-    def _extract_action(self, response: str) -> tuple[str, str]:
-        """Extract action from LLM response"""
-        if "Action:" not in response:
-            return None, None
-        
-        try:
-            action_line = [line for line in response.split('\n') if line.strip().startswith('Action:')][0]
-            action_content = action_line.split('Action:', 1)[1].strip()
-            
-            if ':' in action_content:
-                tool_name, params = action_content.split(':', 1)
-                return tool_name.strip(), params.strip()
-        except Exception as e:
-            logger.warning(f"Failed to extract action: {e}")
-        
-        return None, None
-    
-    def _reflect_on_response(self, user_query: str, response: str) -> str:
-        """Reflection: Self-review and improve response, but return only final message"""
-        reflection_prompt = f"""
-    You are reviewing a chatbot's garden advice response.
+
+_SUMMARY_PROMPT = (
+    "Summarize the conversation below between a user and a garden assistant in "
+    "under 200 tokens. Keep the user's plants, locations, schedules and any advice "
+    "already given. If a previous summary is provided, merge it into the new one. "
+    "Return only the summary."
+)
+
+def _compact_prompt(text: str) -> str:
+    """Drop indentation, trailing spaces and repeated blank lines from a prompt"""
+    lines = [line.strip() for line in text.strip().splitlines()]
+    return "\n".join(
+        line for i, line in enumerate(lines) if line or (i > 0 and lines[i - 1])
+    )
+
+# Static reflection instructions, sent as the system message ahead of the
+# per-call query/response so the provider can reuse the cached prefix
+_REFLECTION_SYSTEM = _compact_prompt("""
+    You are a garden assistant response improver reviewing a chatbot's garden advice response.
     If the response is already good, keep it as is.
     If it can be improved, rewrite it in a clearer, more helpful, and friendly tone.
 
@@ -111,99 +83,471 @@ class GardenAdvisorAgent:
     - Do NOT include explanations, analysis, or lists of improvements.
     - Do NOT show reasoning or mention that it was improved.
     - Keep it natural, like a helpful assistant message.
+    """)
 
-    User Query: {user_query}
-    Your Response: {response}
+_BATCH_REFLECTION_SYSTEM = _compact_prompt("""
+    You are a garden assistant response improver reviewing numbered garden advice responses from a chatbot.
+    For each item: if the response is already good, keep it as is.
+    If it can be improved, rewrite it in a clearer, more helpful, and friendly tone.
 
-    Final improved message:
-    """
+    Important:
+    - Return **only** a JSON array of strings: the final message for each item, in order.
+    - Do NOT include explanations, analysis, or lists of improvements.
+    - Do NOT show reasoning or mention that it was improved.
+    - Keep each message natural, like a helpful assistant message.
+    """)
+
+_LLM_ERROR_MESSAGE = "Sorry, I'm having trouble connecting to the LLM right now."
+PROCESSING_ERROR_MESSAGE = (
+    "I apologize, but I encountered an error processing your request. Please try again."
+)
+# Replies that must never be cached as answers
+ERROR_RESPONSES = frozenset({_LLM_ERROR_MESSAGE, PROCESSING_ERROR_MESSAGE})
+
+# Phrases suggesting a low-confidence answer that is worth a reflection pass
+_HEDGING_MARKERS = ("i'm not sure", "i am not sure", "maybe", "sorry", "error")
+
+class GardenAdvisorAgent:
+    """Main LLM Agent with reasoning, planning, and reflection capabilities"""
     
+    def __init__(self):
+        # Initialize Groq client (compatible with OpenAI API) over one pooled,
+        # keep-alive (HTTP/2 when available) connection set
+        self.client = AsyncOpenAI(
+            api_key=os.getenv('GROQ_API_KEY'),
+            base_url=os.getenv('GROQ_API_BASE', 'https://api.groq.com/openai/v1'),
+            http_client=DefaultAsyncHttpxClient(
+                http2=_HTTP2,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+            )
+        )
+        self.model = os.getenv('GROQ_MODEL', 'mixtral-8x7b-32768')
+
+        # Concurrent requests (e.g. from several users) are flushed together
+        self.dispatcher = BatchDispatcher(
+            self._send_completion,
+            max_batch=int(os.getenv('LLM_BATCH_SIZE', '16')),
+            max_delay=float(os.getenv('LLM_BATCH_WINDOW_MS', '25')) / 1000
+        )
+        
+        self.memory_manager = MemoryManager()
+        self.tool_manager = get_tool_manager()
+        self.planner = Planner()
+        self.llm_cache = LLMCache()
+
+        # Rolling summarization of older short-term turns (refreshed in background)
+        self.summary_refresh_every = 2
+        self._turns_since_summary = defaultdict(int)
+        self._background_tasks = set()
+
+        # Short, confident answers skip the reflection LLM call
+        self.reflection_min_length = 400
+
+        # Tool descriptions are static, so the ReAct prompt is built (and
+        # whitespace-compacted) only once
+        self._system_prompt = _compact_prompt(_SYSTEM_PROMPT_TEMPLATE.format(
+            tools_description=self.tool_manager.get_tools_description()
+        ))
+        
+        logger.info("Garden Advisor Agent initialized")
+    
+    def _format_messages(self, messages) -> List[dict]:
+        """Convert LangChain messages to chat-completion dicts"""
+        return [
+            {"role": "system" if isinstance(m, SystemMessage) else
+                    "user" if isinstance(m, HumanMessage) else
+                    "assistant", "content": (m.content or "").strip()}
+            for m in messages
+        ]
+
+    async def llm(self, messages):
+        """Wrapper for LLM chat completions (identical prompts are served from cache)"""
         try:
-            messages = [
-                SystemMessage(content="You are a garden assistant response improver."),
-                HumanMessage(content=reflection_prompt)
-            ]
+            formatted_messages = self._format_messages(messages)
+            cache_key = self.llm_cache.make_key(self.model, formatted_messages)
+            cached = self.llm_cache.get(cache_key)
+            if cached is not None:
+                logger.debug("LLM cache hit")
+                return AIMessage(content=cached)
+
+            completion = await self.dispatcher.submit(
+                model=self.model,
+                messages=formatted_messages,
+                temperature=0.7
+            )
             
-            reflection = self.llm(messages).content or response
+            self._log_cache_usage(completion)
+            content = completion.choices[0].message.content
+            if content:
+                self.llm_cache.set(cache_key, content)
+            return AIMessage(content=content)
+        except Exception as e:
+            logger.error(f"LLM request failed: {e}", exc_info=True)
+            return AIMessage(content=_LLM_ERROR_MESSAGE)
+
+    async def llm_stream(self, messages) -> AsyncIterator[str]:
+        """Streaming wrapper for LLM chat completions, yields text deltas.
+
+        A request that fails before any text yields the LLM error message; a
+        stream that breaks off mid-response re-raises the error.
+        """
+        received = False
+        try:
+            formatted_messages = self._format_messages(messages)
+            cache_key = self.llm_cache.make_key(self.model, formatted_messages)
+            cached = self.llm_cache.get(cache_key)
+            if cached is not None:
+                logger.debug("LLM cache hit")
+                yield cached
+                return
+
+            stream = await self.dispatcher.submit(
+                model=self.model,
+                messages=formatted_messages,
+                temperature=0.7,
+                stream=True
+            )
+
+            parts = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    received = True
+                    parts.append(delta)
+                    yield delta
+
+            # Only complete streams are cached
+            if parts:
+                self.llm_cache.set(cache_key, "".join(parts))
+        except Exception as e:
+            logger.error(f"LLM stream failed: {e}", exc_info=True)
+            if received:
+                # Callers must not mistake a truncated response for a complete one
+                raise
+            yield _LLM_ERROR_MESSAGE
+
+    async def _send_completion(self, **kwargs):
+        """Send one chat-completion request (called by the dispatcher)"""
+        return await self.client.chat.completions.create(**kwargs)
+
+    def _log_cache_usage(self, completion):
+        """Log prompt-cache hits reported by the provider (if any)"""
+        usage = getattr(completion, 'usage', None)
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = getattr(details, 'cached_tokens', None)
+        if usage is not None and cached_tokens is not None:
+            logger.debug(f"Prompt tokens: {usage.prompt_tokens} (cached: {cached_tokens})")
+
+    def _create_system_prompt(self) -> str:
+        """Create system prompt with ReAct framework (formatted once at init)"""
+        return self._system_prompt
+    
+    def _extract_action(self, response: str) -> tuple[str, str]:
+        """Extract action from LLM response"""
+        match = _ACTION_RE.search(response)
+        if not match:
+            return None, None
+
+        return match.group(1).strip(), match.group(2).strip()
+
+    async def _stream_initial_turn(self, messages, user_id: str) -> Tuple[str, Optional[str], Optional[asyncio.Task]]:
+        """Stream the first ReAct turn, starting the tool as soon as its Action line is complete.
+
+        Returns the full response, the tool name and the running tool task (if any).
+        """
+        buffer = ""
+        tool_name, tool_task = None, None
+
+        try:
+            async for token in self.llm_stream(messages):
+                buffer += token
+                if tool_task is None and '\n' in token:
+                    # Only complete lines are parsed, so the first match is final
+                    tool_name, tool_params = self._extract_action(buffer[:buffer.rfind('\n')])
+                    if tool_name:
+                        tool_task = self._start_tool(tool_name, tool_params, user_id)
+        except BaseException:
+            # The turn is abandoned: don't leave its tool running unobserved
+            if tool_task is not None:
+                tool_task.cancel()
+            raise
+
+        if tool_task is None:
+            tool_name, tool_params = self._extract_action(buffer)
+            if tool_name:
+                tool_task = self._start_tool(tool_name, tool_params, user_id)
+
+        return buffer, tool_name, tool_task
+
+    def _start_tool(self, tool_name: str, tool_params: str, user_id: str) -> asyncio.Task:
+        """Start a tool call without blocking the event loop"""
+        return asyncio.create_task(
+            self.tool_manager.aexecute_tool(tool_name, tool_params, user_id)
+        )
+    
+    def _reflection_messages(self, user_query: str, response: str) -> List:
+        """Reflection prompt: static instructions first so the provider can reuse the cached prefix"""
+        return [
+            SystemMessage(content=_REFLECTION_SYSTEM),
+            HumanMessage(content=(
+                f"User Query: {user_query}\nYour Response: {response}\n\n"
+                "Final improved message:"
+            ))
+        ]
+
+    async def _reflect_on_response(self, user_query: str, response: str) -> str:
+        """Reflection: Self-review and improve response, but return only final message"""
+        try:
+            reflection = (await self.llm(self._reflection_messages(user_query, response))).content
+            if not reflection or reflection == _LLM_ERROR_MESSAGE:
+                # Keep the original answer rather than replacing it with an error
+                return response
             logger.info(f"Reflection completed for query: {user_query[:50]}")
             return reflection.strip()
         except Exception as e:
             logger.error(f"Reflection failed: {e}")
             return response
+
+    async def _stream_reflection(self, user_query: str, response: str) -> AsyncIterator[str]:
+        """Streaming _reflect_on_response: yields the improved message as it is generated,
+        or the original response if the reflection call fails before producing any text"""
+        started = False
+        async for token in self.llm_stream(self._reflection_messages(user_query, response)):
+            if not started and token == _LLM_ERROR_MESSAGE:
+                break
+            started = True
+            yield token
+
+        if started:
+            logger.info(f"Reflection completed for query: {user_query[:50]}")
+        else:
+            yield response
     
-    def process_message(self, user_id: str, message: str) -> str:
+    async def _reflect_on_response_batch(self, pairs: List[Tuple[str, str]]) -> List[str]:
+        """Reflect on several (query, response) pairs with a single LLM call.
+
+        The model returns a JSON array of final messages; any response it fails
+        to return (or the whole batch, on a malformed reply) is kept as is.
+        """
+        if not pairs:
+            return []
+
+        items = "\n\n".join(
+            f"Item {i}\nUser Query: {query}\nYour Response: {response}"
+            for i, (query, response) in enumerate(pairs, 1)
+        )
+        messages = [
+            SystemMessage(content=_BATCH_REFLECTION_SYSTEM),
+            HumanMessage(content=f"{items}\n\nReturn a JSON array of {len(pairs)} strings.")
+        ]
+
+        originals = [response for _, response in pairs]
+        content = (await self.llm(messages)).content or ""
+        try:
+            reflections = json.loads(content[content.index('['):content.rindex(']') + 1])
+        except ValueError as e:
+            logger.error(f"Batch reflection returned no JSON array: {e}")
+            return originals
+
+        if not isinstance(reflections, list) or len(reflections) != len(pairs):
+            logger.error("Batch reflection returned the wrong number of messages")
+            return originals
+
+        logger.info(f"Batch reflection completed for {len(pairs)} responses")
+        return [
+            reflection.strip() if isinstance(reflection, str) and reflection.strip() else original
+            for reflection, original in zip(reflections, originals)
+        ]
+
+    def _needs_reflection(self, response: str) -> bool:
+        """Cheap gate: only long or hedging responses go through reflection"""
+        if len(response) > self.reflection_min_length:
+            return True
+        lowered = response.lower()
+        return any(marker in lowered for marker in _HEDGING_MARKERS)
+
+    async def process_message(self, user_id: str, message: str) -> str:
         """Main message processing with full agent capabilities"""
         logger.info(f"Processing message from user {user_id}: {message[:100]}")
-        
+
         try:
-            # 1. Load user memory
-            conversation_history = self.memory_manager.get_short_term_memory(user_id)
-            relevant_context = self.memory_manager.get_relevant_long_term_memory(user_id, message)
-            
-            # 2. Planning: Determine what needs to be done
-            plan = self.planner.create_plan(message, relevant_context)
-            logger.info(f"Plan created: {plan}")
-            
-            # 3. Reasoning: Build context with memory
-            context_messages = [
-                SystemMessage(content=self._create_system_prompt())
-            ]
-            
-            # Add relevant long-term memory
-            if relevant_context:
-                context_msg = "Relevant context from past conversations:\n" + relevant_context
-                context_messages.append(SystemMessage(content=context_msg))
-            
-            # Add conversation history (short-term memory)
-            context_messages.extend(conversation_history)
-            
-            # Add current query
-            context_messages.append(HumanMessage(content=message))
-            
-            # 4. Initial reasoning and action
-            initial_response = self.llm(context_messages).content
-            logger.info(f"Initial response: {initial_response[:200]}")
-            
-            # 5. Tool usage (if action detected)
-            tool_name, tool_params = self._extract_action(initial_response)
-            
-            if tool_name:
-                tool_result = self.tool_manager.execute_tool(tool_name, tool_params, user_id)
-                logger.info(f"Tool {tool_name} executed: {tool_result[:100]}")
-                
-                # Add observation and generate final answer
-                observation_msg = f"\nObservation: {tool_result}\n\nNow provide the final answer to the user."
-                context_messages.append(AIMessage(content=initial_response))
-                context_messages.append(HumanMessage(content=observation_msg))
-                
-                final_response = self.llm(context_messages).content
-            else:
-                final_response = initial_response
-            
-            # 6. Reflection: Self-review
-            refined_response = self._reflect_on_response(message, final_response)
-            
-            # Extract clean answer
-            if "Answer:" in refined_response:
-                clean_answer = refined_response.split("Answer:", 1)[1].strip()
+            final_response = await self._draft_response(user_id, message)
+            draft_answer = self._clean_answer(final_response)
+
+            # 5. Reflection: Self-review of the answer without the Thought/Action
+            # text (skipped for short, confident answers)
+            if self._needs_reflection(final_response):
+                clean_answer = self._clean_answer(
+                    await self._reflect_on_response(message, draft_answer)
+                )
             else:
-                clean_answer = refined_response
+                clean_answer = draft_answer
             
-            # 7. Update memory
-            self.memory_manager.add_to_short_term_memory(user_id, message, clean_answer)
-            self.memory_manager.add_to_long_term_memory(user_id, message, clean_answer)
+            # 6. Update memory
+            await self._remember_exchange(user_id, message, clean_answer)
             
             logger.info(f"Response generated successfully for user {user_id}")
             return clean_answer
             
         except Exception as e:
             logger.error(f"Error processing message: {e}", exc_info=True)
-            return "I apologize, but I encountered an error processing your request. Please try again."
+            return PROCESSING_ERROR_MESSAGE
+
+    async def process_message_stream(self, user_id: str, message: str) -> AsyncIterator[str]:
+        """Streaming variant of process_message: yields the final answer as it is generated.
+
+        The ReAct turns (and any tool call) run first. Answers that need
+        reflection stream the improved message while the reflection call
+        generates it; short, confident answers skip reflection and are yielded whole.
+        A failure after part of the answer was yielded is re-raised, so callers
+        never mistake a truncated answer for a complete one.
+        """
+        logger.info(f"Processing message (streamed) from user {user_id}: {message[:100]}")
+        yielded = False
+
+        try:
+            final_response = await self._draft_response(user_id, message)
+            draft_answer = self._clean_answer(final_response)
+
+            # 5. Reflection, streamed (same gate and input as process_message)
+            if self._needs_reflection(final_response):
+                parts = []
+                async for delta in self._stream_reflection(message, draft_answer):
+                    parts.append(delta)
+                    yielded = True
+                    yield delta
+                clean_answer = self._clean_answer("".join(parts).strip())
+            else:
+                clean_answer = draft_answer
+                yielded = True
+                yield clean_answer
+
+            await self._remember_exchange(user_id, message, clean_answer)
+            logger.info(f"Streamed response generated successfully for user {user_id}")
+
+        except Exception as e:
+            logger.error(f"Error processing message: {e}", exc_info=True)
+            if yielded:
+                # Part of the answer is already out: let the caller know it is incomplete
+                raise
+            yield PROCESSING_ERROR_MESSAGE
+
+    async def _draft_response(self, user_id: str, message: str) -> str:
+        """Steps 1-4 (memory, planning, reasoning and tool use): the unreflected response"""
+        context_messages, relevant_context = await self._build_context(user_id, message)
+
+        # 3. Planning + initial reasoning: the plan only depends on the retrieved
+        # context, so it runs concurrently with the first (streamed) LLM turn.
+        # 4. Tool usage: a detected action starts while the rest of the turn streams
+        plan, (initial_response, tool_name, tool_task) = await asyncio.gather(
+            self.planner.acreate_plan(message, relevant_context),
+            self._stream_initial_turn(context_messages, user_id)
+        )
+        logger.info(f"Plan created: {plan}")
+        logger.info(f"Initial response: {initial_response[:200]}")
+
+        if tool_task is None:
+            return initial_response
+
+        tool_result = await tool_task
+        logger.info(f"Tool {tool_name} executed: {tool_result[:100]}")
+
+        # Add observation and generate final answer
+        observation_msg = f"\nObservation: {tool_result}\n\nNow provide the final answer to the user."
+        context_messages.append(AIMessage(content=initial_response))
+        context_messages.append(HumanMessage(content=observation_msg))
+
+        return (await self.llm(context_messages)).content
+
+    @staticmethod
+    def _clean_answer(response: str) -> str:
+        """The text after the ReAct "Answer:" marker (the whole response if there is none)"""
+        answer_match = _ANSWER_RE.search(response)
+        return answer_match.group(1).strip() if answer_match else response
+
+    async def _build_context(self, user_id: str, message: str) -> Tuple[List, str]:
+        """Build the LLM context for a message; returns (messages, relevant long-term context)"""
+        # 1. Load user memory (ChromaDB query is blocking, keep it off the event loop).
+        # The message is embedded once and the vector reused for every lookup.
+        conversation_history = self.memory_manager.get_summarized_short_term(user_id)
+        query_embedding = await asyncio.to_thread(self.memory_manager.embed_query, message)
+        relevant_context = await asyncio.to_thread(
+            self.memory_manager.get_relevant_long_term_memory, user_id, message,
+            query_embedding=query_embedding
+        )
+
+        # 2. Reasoning: Build context with memory. The static system prompt stays
+        # the first message so the provider can reuse its cached prefix; volatile
+        # long-term context travels with the current query instead.
+        context_messages = [
+            SystemMessage(content=self._create_system_prompt())
+        ]
+
+        # Add conversation history (short-term memory, older turns summarized)
+        context_messages.extend(conversation_history)
+
+        # Add current query, with relevant long-term memory
+        if relevant_context:
+            query_msg = (
+                "Relevant context from past conversations:\n"
+                f"{relevant_context}\n\nQuery: {message}"
+            )
+        else:
+            query_msg = message
+        context_messages.append(HumanMessage(content=query_msg))
+        return context_messages, relevant_context
+
+    async def _remember_exchange(self, user_id: str, message: str, answer: str):
+        """Store a finished exchange in short- and long-term memory"""
+        self.memory_manager.add_to_short_term_memory(user_id, message, answer)
+        await asyncio.to_thread(
+            self.memory_manager.add_to_long_term_memory, user_id, message, answer
+        )
+        self._schedule_summary_refresh(user_id)
     
+    def _schedule_summary_refresh(self, user_id: str):
+        """Refresh the user's rolling summary every few turns without blocking the reply"""
+        self._turns_since_summary[user_id] += 1
+        if self._turns_since_summary[user_id] < self.summary_refresh_every:
+            return
+
+        older_turns = self.memory_manager.get_older_short_term(user_id)
+        if not older_turns:
+            return
+
+        self._turns_since_summary[user_id] = 0
+        task = asyncio.create_task(self._refresh_summary(user_id, older_turns))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _refresh_summary(self, user_id: str, older_turns: List):
+        """Summarize older short-term turns (merged with the previous summary)"""
+        transcript = "\n".join(
+            f"{'User' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}"
+            for m in older_turns
+        )
+        previous = self.memory_manager.get_short_term_summary(user_id)
+        if previous:
+            transcript = f"Previous summary:\n{previous}\n\nConversation:\n{transcript}"
+
+        summary = (await self.llm([
+            SystemMessage(content=_SUMMARY_PROMPT),
+            HumanMessage(content=transcript)
+        ])).content
+
+        if summary and summary != _LLM_ERROR_MESSAGE:
+            self.memory_manager.set_short_term_summary(user_id, summary.strip())
+            logger.info(f"Refreshed conversation summary for user {user_id}")
+
     def get_user_plants(self, user_id: str) -> List[str]:
         """Get list of plants for a user"""
         return self.memory_manager.get_user_plants(user_id)
     
     def cleanup(self):
         """Cleanup resources"""
-        logger.info("Cleaning up agent resources")
\ No newline at end of file
+        logger.info("Cleaning up agent resources")
+        self.dispatcher.close()
+        self.llm_cache.close()
+        self.tool_manager.cleanup()
\ No newline at end of file
@@ -0,0 +1,208 @@
+"""
+Response Cache
+On-disk (SQLite) caches of LLM responses, keyed by the exact prompt or by
+query similarity
+"""
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from core.memory import cosine_topk
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCache:
+    """Exact-match LLM response cache with a time-to-live"""
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None):
+        self.path = path or os.getenv('LLM_CACHE_PATH', './data/llm_cache.sqlite3')
+        self.ttl = ttl if ttl is not None else float(os.getenv('LLM_CACHE_TTL', '86400'))
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # One connection shared by the event loop and worker threads
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, content TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+        logger.info(f"LLM cache ready at {self.path}")
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]]) -> str:
+        """Hash the model and every message, so different histories never collide"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(model.encode())
+        for m in messages:
+            h.update(b'\x1e' + m['role'].encode() + b'\x1f' + (m['content'] or '').encode())
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response, or None if missing or expired"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        content, expires_at = row
+        if expires_at < time.time():
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            return None
+        return content
+
+    def set(self, key: str, content: str):
+        """Store a response for ttl seconds"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, content, expires_at) VALUES (?, ?, ?)",
+                (key, content, time.time() + self.ttl)
+            )
+
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+
+class SemanticCache:
+    """Per-user cache of final answers, looked up by query-embedding similarity.
+
+    Near-duplicate questions ("how do I care for tomatoes?" / "care tips for
+    tomato?") hit the same entry without another agent run. Entries expire
+    after ttl seconds; past max_entries the least recently used are evicted.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None,
+                 threshold: Optional[float] = None, max_entries: Optional[int] = None):
+        self.path = path or os.getenv('SEMANTIC_CACHE_PATH', './data/semantic_cache.sqlite3')
+        self.ttl = ttl if ttl is not None else float(os.getenv('SEMANTIC_CACHE_TTL', '86400'))
+        self.threshold = (threshold if threshold is not None
+                          else float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.85')))
+        # ~1-2 KB per entry (float16 vector + answer), so the default stays around 10 MB
+        self.max_entries = (max_entries if max_entries is not None
+                            else int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '5000')))
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS semantic_cache ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, "
+                "embedding BLOB NOT NULL, response TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS semantic_cache_user ON semantic_cache (user_id)"
+            )
+            self._conn.execute("DELETE FROM semantic_cache WHERE expires_at < ?", (time.time(),))
+
+        # user_id -> (row ids, row-normalized float16 embeddings), loaded on first lookup
+        self._vectors: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+        logger.info(f"Semantic cache ready at {self.path}")
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        """Unit-normalize one embedding and store it compactly as float16"""
+        vec = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec).astype(np.float16)
+
+    def _get_user_vectors(self, user_id: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Load a user's live entries into memory once; the lock must be held"""
+        if user_id not in self._vectors:
+            rows = self._conn.execute(
+                "SELECT id, embedding FROM semantic_cache WHERE user_id = ? AND expires_at >= ?",
+                (user_id, time.time())
+            ).fetchall()
+            ids = np.array([row[0] for row in rows], dtype=np.int64)
+            mat = np.array([np.frombuffer(row[1], dtype=np.float16) for row in rows])
+            self._vectors[user_id] = (ids, mat)
+        return self._vectors[user_id]
+
+    def get(self, user_id: str, embedding) -> Optional[str]:
+        """Return the cached answer closest to embedding, or None below the threshold"""
+        with self._lock:
+            ids, mat = self._get_user_vectors(user_id)
+            top, similarities = cosine_topk(embedding, mat, 1)
+            if not len(top) or similarities[0] < self.threshold:
+                return None
+
+            entry_id = int(ids[top[0]])
+            row = self._conn.execute(
+                "SELECT response, expires_at FROM semantic_cache WHERE id = ?", (entry_id,)
+            ).fetchone()
+            now = time.time()
+            with self._conn:
+                if row is None or row[1] < now:
+                    self._conn.execute("DELETE FROM semantic_cache WHERE id = ?", (entry_id,))
+                    self._vectors.pop(user_id, None)
+                    return None
+                self._conn.execute(
+                    "UPDATE semantic_cache SET last_used = ? WHERE id = ?", (now, entry_id)
+                )
+
+        logger.debug(f"Semantic cache hit for user {user_id} (similarity {similarities[0]:.3f})")
+        return row[0]
+
+    def set(self, user_id: str, embedding, response: str):
+        """Store an answer for ttl seconds, evicting the least recently used past max_entries"""
+        vec = self._normalize(embedding)
+        now = time.time()
+        with self._lock, self._conn:
+            entry_id = self._conn.execute(
+                "INSERT INTO semantic_cache (user_id, embedding, response, expires_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (user_id, vec.tobytes(), response, now + self.ttl, now)
+            ).lastrowid
+            if user_id in self._vectors:
+                ids, mat = self._vectors[user_id]
+                self._vectors[user_id] = (
+                    np.append(ids, entry_id), np.vstack([mat.reshape(-1, len(vec)), vec])
+                )
+            self._evict()
+
+    def _evict(self):
+        """Drop the least recently used entries over max_entries; the lock must be held"""
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM semantic_cache").fetchone()
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+
+        evicted = self._conn.execute(
+            "SELECT id, user_id FROM semantic_cache ORDER BY last_used LIMIT ?", (excess,)
+        ).fetchall()
+        self._conn.executemany(
+            "DELETE FROM semantic_cache WHERE id = ?", [(entry_id,) for entry_id, _ in evicted]
+        )
+        for _, user_id in evicted:
+            self._vectors.pop(user_id, None)
+        logger.debug(f"Evicted {len(evicted)} semantic cache entries")
+
+    def clear_user(self, user_id: str):
+        """Remove every cached answer for a user"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM semantic_cache WHERE user_id = ?", (user_id,))
+            self._vectors.pop(user_id, None)
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
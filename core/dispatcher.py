@@ -0,0 +1,99 @@
+"""
+LLM Request Dispatcher
+Coalesces concurrent LLM requests into short micro-batches sent together
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BatchDispatcher:
+    """Collects requests for up to max_delay seconds (or max_batch items) and
+    sends them concurrently over the shared HTTP client.
+
+    Groq has no batch endpoint for chat completions, so a batch is a set of
+    parallel requests; sending them together lets them share pooled
+    (HTTP/2 multiplexed) connections. That only helps under concurrency, so a
+    request arriving while the dispatcher is idle is sent straight away.
+    """
+
+    def __init__(self, send: Callable[..., Awaitable[Any]], max_batch: int = 16,
+                 max_delay: float = 0.025):
+        self._send = send
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._in_flight = set()
+
+    async def submit(self, **kwargs) -> Any:
+        """Queue one request and wait for its result"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((kwargs, future))
+        return await future
+
+    def _ensure_worker(self):
+        """Start the flush worker on the running loop (restarted if the loop changed)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        """Flush a batch every max_delay seconds or as soon as it is full"""
+        batch = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                # Idle (nothing else queued or in flight): waiting can't gather a
+                # batch worth having, so only hold the window open under load
+                busy = not self._queue.empty() or self._in_flight
+                deadline = self._loop.time() + self.max_delay
+
+                while busy and len(batch) < self.max_batch:
+                    timeout = deadline - self._loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                logger.debug(f"Dispatching LLM batch of {len(batch)} request(s)")
+                # Don't wait for the batch to finish before collecting the next one
+                task = asyncio.ensure_future(
+                    asyncio.gather(*(self._dispatch(kwargs, future) for kwargs, future in batch))
+                )
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+                batch = []
+        finally:
+            # Stopped while collecting: these requests will never be sent
+            for _, future in batch:
+                future.cancel()
+
+    async def _dispatch(self, kwargs, future: asyncio.Future):
+        """Send one request and resolve its future"""
+        try:
+            result = await self._send(**kwargs)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    def close(self):
+        """Stop the flush worker; requests not yet sent are cancelled, sent ones still complete"""
+        if self._worker is not None and not self._loop.is_closed():
+            self._worker.cancel()
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                future.cancel()
+        self._worker = None
@@ -0,0 +1,96 @@
+"""
+Embedding Functions
+Shared MiniLM (ONNX) embedding model used by all ChromaDB collections
+"""
+import os
+import logging
+from functools import cached_property
+from typing import List, Optional
+
+from chromadb.api.types import DefaultEmbeddingFunction, Documents, Embeddings
+from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+
+logger = logging.getLogger(__name__)
+
+
+class _MiniLMOnnx(ONNXMiniLM_L6_V2):
+    """all-MiniLM-L6-v2 ONNX runner with configurable providers, threads and int8 weights"""
+
+    QUANTIZED_MODEL_NAME = "model_int8.onnx"
+
+    def __init__(self, preferred_providers: Optional[List[str]] = None, intra_op_threads: int = 0,
+                 quantize: bool = False):
+        super().__init__(preferred_providers=preferred_providers)
+        self._intra_op_threads = intra_op_threads
+        self._quantize = quantize
+
+    def _model_path(self) -> str:
+        """Path of the ONNX model to load, quantizing it to int8 on first use if enabled"""
+        folder = os.path.join(self.DOWNLOAD_PATH, self.EXTRACTED_FOLDER_NAME)
+        fp32_path = os.path.join(folder, "model.onnx")
+        if not self._quantize:
+            return fp32_path
+
+        int8_path = os.path.join(folder, self.QUANTIZED_MODEL_NAME)
+        if os.path.exists(int8_path):
+            return int8_path
+
+        try:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+            logger.info(f"Quantized embedding model to int8: {int8_path}")
+            return int8_path
+        except Exception as e:
+            logger.warning(f"Int8 quantization unavailable, using FP32 embedding model: {e}")
+            return fp32_path
+
+    @cached_property
+    def model(self):
+        """Create the ONNX inference session once"""
+        available = self.ort.get_available_providers()
+        providers = [p for p in (self._preferred_providers or available) if p in available]
+
+        so = self.ort.SessionOptions()
+        so.log_severity_level = 3
+        so.graph_optimization_level = self.ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self._intra_op_threads > 0:
+            so.intra_op_num_threads = self._intra_op_threads
+
+        logger.info(f"Loading embedding model with providers: {providers}")
+        return self.ort.InferenceSession(
+            self._model_path(),
+            providers=providers,
+            sess_options=so,
+        )
+
+
+class SharedEmbeddingFunction(DefaultEmbeddingFunction):
+    """Chroma's default embedding, backed by a single long-lived ONNX session.
+
+    DefaultEmbeddingFunction builds a new ONNX runner on every call; this keeps
+    one instance (and one copy of the weights) for every collection using it.
+    It keeps the "default" name so existing persisted collections still load.
+    """
+
+    def __init__(self, preferred_providers: Optional[List[str]] = None, intra_op_threads: int = 0,
+                 quantize: bool = False):
+        super().__init__()
+        self._runner = _MiniLMOnnx(preferred_providers, intra_op_threads, quantize)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return self._runner(input)
+
+
+def create_embedding_function() -> SharedEmbeddingFunction:
+    """Build the shared embedding function from environment settings"""
+    providers = [
+        p.strip() for p in os.getenv('EMBEDDING_PROVIDERS', 'CPUExecutionProvider').split(',')
+        if p.strip()
+    ]
+    threads = int(os.getenv('EMBEDDING_THREADS', '0'))
+    # int8 vectors differ slightly from FP32 ones, so quantization is opt-in
+    # (re-index existing collections after enabling it)
+    quantize = os.getenv('EMBEDDING_QUANTIZE', '').lower() == 'int8'
+    return SharedEmbeddingFunction(
+        preferred_providers=providers, intra_op_threads=threads, quantize=quantize
+    )
@@ -3,23 +3,117 @@ Memory Management System
 Implements both short-term (conversation buffer) and long-term (ChromaDB) memory per user
 """
 import os
+import re
+import time
 import logging
-from typing import List, Dict
-from collections import defaultdict
-from langchain_core.messages import HumanMessage, AIMessage
+import functools
+from typing import List, Dict, Optional, Tuple
+from collections import defaultdict, deque
+import numpy as np
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 import chromadb
 from chromadb.config import Settings
 
+from core.embeddings import SharedEmbeddingFunction, create_embedding_function
+
 logger = logging.getLogger(__name__)
 
+PLANT_KEYWORDS = ['tomato', 'basil', 'rose', 'cactus', 'orchid', 'mint', 'lettuce']
+
+_PLANT_DOC_TEMPLATE = (
+    "{name}: Water {water_frequency}, Sunlight: {sunlight}, Soil: {soil}, Tips: {tips}"
+)
+
+
+def cosine_topk(query_vec, mat: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k rows of a row-normalized matrix by cosine similarity to query_vec.
+
+    Returns (indices, similarities), best match first. One matrix-vector
+    product scores every row, so this is cheap for small in-process sets.
+    """
+    if len(mat) == 0 or k <= 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+    q = np.asarray(query_vec, dtype=np.float32)
+    scores = mat.astype(np.float32, copy=False) @ (q / np.linalg.norm(q))
+
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return top, scores[top]
+
+
+def _normalize_rows(vectors) -> np.ndarray:
+    """Unit-normalize embeddings and store them compactly as float16"""
+    mat = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (mat / norms).astype(np.float16)
+
+
 class MemoryManager:
     """Manages per-user short-term and long-term memory"""
+
+    # Shared by every MemoryManager in the process (each agent, each test): one
+    # embedding model, and the plant knowledge embeddings keyed by their documents
+    # so a fresh ChromaDB directory is seeded without another embedding pass
+    _embed_fn: Optional[SharedEmbeddingFunction] = None
+    _plant_index: Optional[Tuple[Tuple[str, ...], list]] = None
+
+    @classmethod
+    def _shared_embedding_function(cls) -> SharedEmbeddingFunction:
+        """Build the embedding model once per process"""
+        if cls._embed_fn is None:
+            cls._embed_fn = create_embedding_function()
+        return cls._embed_fn
+
+    @classmethod
+    def _plant_embeddings(cls, docs: List[str]) -> list:
+        """Embeddings of the plant documents, computed once per process"""
+        key = tuple(docs)
+        if cls._plant_index is None or cls._plant_index[0] != key:
+            cls._plant_index = (key, cls._shared_embedding_function()(docs))
+        return cls._plant_index[1]
     
     def __init__(self):
         # Short-term memory: per-user conversation buffer
-        self.short_term_memory: Dict[str, List] = defaultdict(list)
-        self.max_short_term = 10  # Keep last 10 messages per user
+        self.max_short_term = 10  # Keep last 10 turns (user + assistant) per user
+        self.short_term_memory: Dict[str, deque] = defaultdict(
+            lambda: deque(maxlen=self.max_short_term * 2)
+        )
+
+        # Rolling summaries of older turns: when a summary exists only the last
+        # `recent_turns` turns are sent verbatim
+        self.recent_turns = 4
+        self._summary_cache: Dict[str, str] = {}
+
+        # Per-user long-term document counters (lazily seeded from ChromaDB):
+        # next id suffix and number of stored documents
+        self._user_counters: Dict[str, int] = {}
+        self._user_doc_counts: Dict[str, int] = {}
+        self.dedup_threshold = 0.95  # Skip writes this similar to a stored exchange
+
+        # Per-user normalized embedding matrices (lazily loaded from ChromaDB) for
+        # in-process similarity checks without a Chroma round-trip
+        self._user_vecs: Dict[str, np.ndarray] = {}
+
+        # Long-term eviction: keep at most max_long_term_per_user entries, dropping
+        # the lowest importance * (1 - w) + exp(-decay * age_hours) * w first
+        self.max_long_term_per_user = 500
+        self.eviction_recency_weight = 0.5
+        self.eviction_decay = 0.01
+
+        # Single-pass plant matcher (whole words, plurals allowed: "tomatoes")
+        self._plant_re = re.compile(
+            r'\b(' + '|'.join(map(re.escape, PLANT_KEYWORDS)) + r')(?:e?s)?\b',
+            re.IGNORECASE
+        )
         
+        # Shared embedding model (one ONNX session for both collections) + cache
+        # so a query is embedded once per turn
+        self.embed_fn = self._shared_embedding_function()
+        self._embed_cached = functools.lru_cache(maxsize=512)(self._embed)
+
         # Long-term memory: ChromaDB
         chroma_path = os.getenv('CHROMA_DB_PATH', './data/chroma')
         os.makedirs(chroma_path, exist_ok=True)
@@ -29,16 +123,24 @@ class MemoryManager:
         # Create or get collections
         self.memory_collection = self.chroma_client.get_or_create_collection(
             name=os.getenv('CHROMA_COLLECTION', 'garden_memory'),
-            metadata={"description": "Long-term user conversations and context"}
+            metadata={"description": "Long-term user conversations and context"},
+            embedding_function=self.embed_fn
         )
         
         self.plant_collection = self.chroma_client.get_or_create_collection(
             name="plant_knowledge",
-            metadata={"description": "Plant care knowledge base"}
+            metadata={"description": "Plant care knowledge base"},
+            embedding_function=self.embed_fn
         )
         
         # Initialize plant knowledge
         self._initialize_plant_knowledge()
+
+        # The plant knowledge base is static after init, so results are reused for
+        # near-duplicate queries: n_results -> (normalized query vectors, results)
+        self.plant_cache_threshold = 0.95
+        self.plant_cache_size = 256
+        self._plant_cache: Dict[int, Tuple[np.ndarray, List[str]]] = {}
         
         logger.info("Memory Manager initialized")
     
@@ -103,34 +205,57 @@ class MemoryManager:
                 logger.info(f"Plant knowledge already indexed: {len(existing['ids'])} plants")
                 return
             
-            # Index plants
+            # Index plants in a single batched insert (one embedding pass).
+            # Batched adds reject duplicate ids, so the first entry per name wins
+            unique_plants = {}
             for plant in plants:
-                doc_text = f"{plant['name']}: Water {plant['water_frequency']}, " \
-                          f"Sunlight: {plant['sunlight']}, Soil: {plant['soil']}, " \
-                          f"Tips: {plant['tips']}"
-                
-                self.plant_collection.add(
-                    documents=[doc_text],
-                    metadatas=[{"plant_name": plant['name']}],
-                    ids=[f"plant_{plant['name'].lower()}"]
-                )
-            
-            logger.info(f"Indexed {len(plants)} plants into knowledge base")
+                unique_plants.setdefault(f"plant_{plant['name'].lower()}", plant)
+
+            ids = list(unique_plants)
+            docs = [_PLANT_DOC_TEMPLATE.format_map(plant) for plant in unique_plants.values()]
+            metas = [{"plant_name": plant['name']} for plant in unique_plants.values()]
+
+            self.plant_collection.add(
+                documents=docs, metadatas=metas, ids=ids,
+                embeddings=self._plant_embeddings(docs)
+            )
+
+            logger.info(f"Indexed {len(ids)} plants into knowledge base")
         except Exception as e:
             logger.error(f"Failed to initialize plant knowledge: {e}")
     
     def get_short_term_memory(self, user_id: str) -> List:
         """Get conversation history for user (short-term memory)"""
-        return self.short_term_memory.get(user_id, [])[-self.max_short_term:]
+        return list(self.short_term_memory.get(user_id, ()))
     
+    def get_summarized_short_term(self, user_id: str) -> List:
+        """Get conversation history with older turns replaced by their summary"""
+        history = self.get_short_term_memory(user_id)
+        summary = self._summary_cache.get(user_id)
+        if not summary:
+            return history
+
+        recent = history[-self.recent_turns * 2:]
+        return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"), *recent]
+
+    def get_older_short_term(self, user_id: str) -> List:
+        """Get the short-term turns that fall outside the verbatim window"""
+        return self.get_short_term_memory(user_id)[:-self.recent_turns * 2]
+
+    def get_short_term_summary(self, user_id: str) -> str:
+        """Get the current rolling summary for a user (empty if none)"""
+        return self._summary_cache.get(user_id, "")
+
+    def set_short_term_summary(self, user_id: str, summary: str):
+        """Store the rolling summary of a user's older turns"""
+        self._summary_cache[user_id] = summary
+        logger.debug(f"Updated short-term summary for user {user_id}")
+
     def add_to_short_term_memory(self, user_id: str, user_msg: str, ai_msg: str):
-        """Add conversation turn to short-term memory"""
-        self.short_term_memory[user_id].append(HumanMessage(content=user_msg))
-        self.short_term_memory[user_id].append(AIMessage(content=ai_msg))
-        
-        # Keep only recent messages
-        if len(self.short_term_memory[user_id]) > self.max_short_term * 2:
-            self.short_term_memory[user_id] = self.short_term_memory[user_id][-self.max_short_term * 2:]
+        """Add conversation turn to short-term memory (bounded deque evicts old turns)"""
+        history = self.short_term_memory[user_id]
+        history.append(HumanMessage(content=user_msg))
+        history.append(AIMessage(content=ai_msg))
         
         logger.debug(f"Added to short-term memory for user {user_id}")
     
@@ -138,23 +263,150 @@ class MemoryManager:
         """Add conversation to long-term memory (ChromaDB)"""
         try:
             doc_text = f"User: {user_msg}\nAssistant: {ai_msg}"
-            doc_id = f"{user_id}_{len(self.memory_collection.get(where={'user_id': user_id})['ids'])}"
+            embedding = self._embed(doc_text)
+
+            if self._is_duplicate(user_id, embedding):
+                logger.debug(f"Skipped near-duplicate long-term memory for user {user_id}")
+                return
+
+            doc_id = f"{user_id}_{self._next_doc_index(user_id)}"
             
             self.memory_collection.add(
                 documents=[doc_text],
-                metadatas=[{"user_id": user_id}],
+                embeddings=[embedding],
+                metadatas=[self._memory_metadata(user_id, doc_text)],
                 ids=[doc_id]
             )
+            self._append_user_vecs(user_id, [embedding])
             
             logger.debug(f"Added to long-term memory for user {user_id}")
+            self._evict(user_id)
         except Exception as e:
             logger.error(f"Failed to add to long-term memory: {e}")
-    
-    def get_relevant_long_term_memory(self, user_id: str, query: str, n_results: int = 3) -> str:
+
+    def _is_duplicate(self, user_id: str, embedding) -> bool:
+        """Check whether a near-identical exchange is already stored for the user"""
+        _, similarities = cosine_topk(embedding, self._get_user_vecs(user_id), 1)
+        return len(similarities) > 0 and similarities[0] > self.dedup_threshold
+
+    def _get_user_vecs(self, user_id: str) -> np.ndarray:
+        """Normalized embedding matrix of a user's long-term entries (loaded once)"""
+        if user_id not in self._user_vecs:
+            results = self.memory_collection.get(where={"user_id": user_id}, include=["embeddings"])
+            embeddings = results['embeddings']
+            if embeddings is None or len(embeddings) == 0:
+                self._user_vecs[user_id] = np.empty((0, 0), dtype=np.float16)
+            else:
+                self._user_vecs[user_id] = _normalize_rows(embeddings)
+        return self._user_vecs[user_id]
+
+    def _append_user_vecs(self, user_id: str, embeddings):
+        """Keep an already-loaded user matrix in sync with new writes"""
+        mat = self._user_vecs.get(user_id)
+        if mat is None:
+            return
+        rows = _normalize_rows(embeddings)
+        self._user_vecs[user_id] = rows if len(mat) == 0 else np.vstack([mat, rows])
+
+    def add_many(self, user_id: str, exchanges: List[Tuple[str, str]]):
+        """Add several (user_msg, ai_msg) turns to long-term memory in one insert"""
+        if not exchanges:
+            return
+
+        try:
+            docs = [f"User: {user_msg}\nAssistant: {ai_msg}" for user_msg, ai_msg in exchanges]
+            ids = [f"{user_id}_{self._next_doc_index(user_id)}" for _ in exchanges]
+            embeddings = self.embed_fn(docs)
+
+            self.memory_collection.add(
+                documents=docs,
+                embeddings=embeddings,
+                metadatas=[self._memory_metadata(user_id, doc) for doc in docs],
+                ids=ids
+            )
+            self._append_user_vecs(user_id, embeddings)
+
+            logger.debug(f"Added {len(docs)} entries to long-term memory for user {user_id}")
+            self._evict(user_id)
+        except Exception as e:
+            logger.error(f"Failed to bulk add to long-term memory: {e}")
+
+    def _next_doc_index(self, user_id: str) -> int:
+        """Return the next long-term document index for a user.
+
+        ChromaDB is only scanned (ids only) the first time a user is seen; after
+        that the counters are kept in-process so each write is O(1). The index
+        continues after the highest stored suffix, since eviction leaves gaps.
+        """
+        if user_id not in self._user_counters:
+            existing = self.memory_collection.get(where={'user_id': user_id}, include=[])
+            suffixes = [
+                int(doc_id.rsplit('_', 1)[1]) for doc_id in existing['ids']
+                if doc_id.rsplit('_', 1)[-1].isdigit()
+            ]
+            self._user_counters[user_id] = max(suffixes, default=-1) + 1
+            self._user_doc_counts[user_id] = len(existing['ids'])
+
+        index = self._user_counters[user_id]
+        self._user_counters[user_id] += 1
+        self._user_doc_counts[user_id] += 1
+        return index
+
+    def _memory_metadata(self, user_id: str, doc_text: str) -> Dict:
+        """Metadata stored with each long-term entry (used for eviction)"""
+        # Exchanges that mention the user's plants are worth keeping longer
+        importance = 1.0 if self._plant_re.search(doc_text) else 0.5
+        return {"user_id": user_id, "timestamp": time.time(), "importance": importance}
+
+    def _evict(self, user_id: str):
+        """Drop the lowest-scoring entries once a user exceeds the per-user cap"""
+        excess = self._user_doc_counts.get(user_id, 0) - self.max_long_term_per_user
+        if excess <= 0:
+            return
+
+        try:
+            results = self.memory_collection.get(where={"user_id": user_id}, include=["metadatas"])
+            metadatas = results['metadatas']
+
+            # Entries written before eviction existed have no timestamp: treat as oldest
+            timestamps = np.array([m.get('timestamp', 0.0) for m in metadatas], dtype=np.float64)
+            importance = np.array([m.get('importance', 0.5) for m in metadatas], dtype=np.float64)
+            ages_hours = (time.time() - timestamps) / 3600.0
+
+            w = self.eviction_recency_weight
+            scores = importance * (1 - w) + np.exp(-self.eviction_decay * ages_hours) * w
+
+            excess = len(scores) - self.max_long_term_per_user
+            if excess <= 0:
+                self._user_doc_counts[user_id] = len(scores)
+                return
+
+            worst = np.argpartition(scores, excess - 1)[:excess]
+            self.memory_collection.delete(ids=[results['ids'][i] for i in worst])
+            self._user_doc_counts[user_id] = len(scores) - excess
+            self._user_vecs.pop(user_id, None)  # Reloaded on next use
+
+            logger.debug(f"Evicted {excess} long-term memories for user {user_id}")
+        except Exception as e:
+            logger.error(f"Failed to evict long-term memory: {e}")
+
+    def _embed(self, text: str):
+        """Embed a single text with the shared embedding function"""
+        return self.embed_fn([text])[0]
+
+    def embed_query(self, query: str):
+        """Return the (cached) embedding for a query string"""
+        return self._embed_cached(query)
+
+    def get_relevant_long_term_memory(self, user_id: str, query: str, n_results: int = 3,
+                                      query_embedding=None) -> str:
         """Retrieve relevant past conversations (RAG from long-term memory)"""
         try:
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
+
             results = self.memory_collection.query(
-                query_texts=[query],
+                query_embeddings=[query_embedding],
                 where={"user_id": user_id},
                 n_results=n_results
             )
@@ -168,23 +420,70 @@ class MemoryManager:
         
         return ""
     
-    def get_plant_knowledge(self, query: str, n_results: int = 2) -> str:
+    def get_plant_knowledge(self, query: str, n_results: int = 2, query_embedding=None) -> str:
         """Retrieve plant care knowledge (RAG)"""
         try:
-            results = self.plant_collection.query(
-                query_texts=[query],
-                n_results=n_results
-            )
-            
-            if results['documents'] and results['documents'][0]:
-                knowledge = "\n\n".join(results['documents'][0])
-                logger.debug(f"Retrieved plant knowledge: {knowledge[:100]}")
-                return knowledge
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
+            return self._plant_knowledge_for([query_embedding], n_results)[0]
         except Exception as e:
             logger.error(f"Failed to retrieve plant knowledge: {e}")
         
         return ""
-    
+
+    def get_plant_knowledge_batch(self, queries: List[str], n_results: int = 2) -> List[str]:
+        """Retrieve plant care knowledge for several queries: one embedding batch
+        and one ChromaDB query for all of them"""
+        if not queries:
+            return []
+        try:
+            return self._plant_knowledge_for(self.embed_fn(queries), n_results)
+        except Exception as e:
+            logger.error(f"Failed to retrieve plant knowledge: {e}")
+        
+        return [""] * len(queries)
+
+    def _plant_knowledge_for(self, query_embeddings, n_results: int) -> List[str]:
+        """Knowledge per query embedding, from the cache or a single batched query"""
+        knowledge = [self._get_cached_plant_knowledge(emb, n_results) for emb in query_embeddings]
+        misses = [i for i, found in enumerate(knowledge) if found is None]
+        if not misses:
+            return knowledge
+
+        results = self.plant_collection.query(
+            query_embeddings=[query_embeddings[i] for i in misses],
+            n_results=n_results
+        )
+        documents = results['documents'] or []
+        for i, docs in zip(misses, documents):
+            if docs:
+                knowledge[i] = "\n\n".join(docs)
+                logger.debug(f"Retrieved plant knowledge: {knowledge[i][:100]}")
+                self._cache_plant_knowledge(query_embeddings[i], n_results, knowledge[i])
+        return [found or "" for found in knowledge]
+
+    def _get_cached_plant_knowledge(self, query_embedding, n_results: int):
+        """Knowledge retrieved for a near-identical query, or None"""
+        vecs, results = self._plant_cache.get(n_results, (None, None))
+        if vecs is None:
+            return None
+
+        top, similarities = cosine_topk(query_embedding, vecs, 1)
+        if len(top) and similarities[0] >= self.plant_cache_threshold:
+            logger.debug(f"Plant knowledge cache hit (similarity {similarities[0]:.3f})")
+            return results[top[0]]
+        return None
+
+    def _cache_plant_knowledge(self, query_embedding, n_results: int, knowledge: str):
+        """Remember a retrieval result, dropping the oldest past plant_cache_size"""
+        row = _normalize_rows([query_embedding])
+        vecs, results = self._plant_cache.get(n_results, (None, []))
+        vecs = row if vecs is None else np.vstack([vecs, row])
+        results = results + [knowledge]
+        self._plant_cache[n_results] = (
+            vecs[-self.plant_cache_size:], results[-self.plant_cache_size:]
+        )
+
     def get_user_plants(self, user_id: str) -> List[str]:
         """Extract list of plants mentioned by user"""
         try:
@@ -193,15 +492,12 @@ class MemoryManager:
                 where={"user_id": user_id}
             )
             
-            plants = set()
-            plant_keywords = ['tomato', 'basil', 'rose', 'cactus', 'orchid', 'mint', 'lettuce']
-            
-            for doc in results['documents']:
-                doc_lower = doc.lower()
-                for plant in plant_keywords:
-                    if plant in doc_lower:
-                        plants.add(plant.capitalize())
-            
+            plants = {
+                match.group(1).capitalize()
+                for doc in results['documents']
+                for match in self._plant_re.finditer(doc)
+            }
+
             return list(plants)
         except Exception as e:
             logger.error(f"Failed to get user plants: {e}")
@@ -230,6 +526,10 @@ class MemoryManager:
     def clear_user_memory(self, user_id: str):
         """Clear all memory for a user"""
         self.short_term_memory.pop(user_id, None)
+        self._summary_cache.pop(user_id, None)
+        self._user_counters.pop(user_id, None)
+        self._user_doc_counts.pop(user_id, None)
+        self._user_vecs.pop(user_id, None)
         
         try:
             # Clear from ChromaDB
@@ -4,10 +4,29 @@ Breaks down complex or multilingual queries into executable plans.
 """
 
 import os
+import re
 import logging
-from typing import Dict
+import functools
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # fall back to the stdlib json module
+    import json
+    _json_loads = json.loads
+
+try:
+    import ahocorasick
+except ImportError:  # C extension; fall back to marisa-trie or a compiled regex
+    ahocorasick = None
+
+try:
+    import marisa_trie  # optional compact trie index for very large keyword sets
+except ImportError:
+    marisa_trie = None
+
 # === Load environment variables ===
 load_dotenv()
 
@@ -17,9 +36,179 @@ from langchain_core.messages import HumanMessage
 
 logger = logging.getLogger(__name__)
 
+# Rule-based query keywords (English + Indonesian), in priority order
+QUERY_KEYWORDS = {
+    'weather_check': [
+        'weather', 'rain', 'temperature', 'forecast', 'should i water',
+        'cuaca', 'hujan', 'suhu', 'prakiraan', 'apakah perlu menyiram'
+    ],
+    'reminder': [
+        'remind', 'schedule', 'set reminder', 'notify',
+        'ingatkan', 'jadwal', 'pengingat', 'buat pengingat'
+    ],
+    'calculation': [
+        'calculate', 'how much', 'how many', 'liters', 'gallons',
+        'hitung', 'berapa', 'jumlah', 'liter', 'galon'
+    ],
+    'search': [
+        'search', 'find', 'look up', 'information about',
+        'cari', 'temukan', 'informasi tentang'
+    ],
+    'plant_care': [
+        'how to', 'care for', 'grow', 'plant', 'sunlight',
+        'cara merawat', 'tanam', 'menyiram', 'pupuk', 'tanaman'
+    ],
+}
+_QUERY_TYPES = tuple(QUERY_KEYWORDS)
+
+_LLM_PROMPT_TEMPLATE = """
+        You are a planning assistant for a smart chatbot.
+        The user asked: "{query}"
+        Context: {context}
+
+        Your task:
+        1. Understand the user's intent (in any language).
+        2. Break the goal into 3-5 short, actionable steps.
+        3. Return the plan in JSON format with these fields:
+        - type: short label of the task
+        - steps: list of steps
+        - requires_tools: true/false
+        - estimated_complexity: low/medium/high
+        """
+
+
+def _build_keyword_matcher():
+    """Build a single-pass matcher over all category keywords"""
+    # Keyword -> category priority (first category listed wins on duplicates)
+    kw_priority = {}
+    for priority, keywords in enumerate(QUERY_KEYWORDS.values()):
+        for kw in keywords:
+            kw_priority.setdefault(kw, priority)
+
+    if ahocorasick is not None:
+        # STORE_INTS keeps the priority payloads as C integers inside the automaton
+        automaton = ahocorasick.Automaton(ahocorasick.STORE_INTS)
+        for kw, priority in kw_priority.items():
+            automaton.add_word(kw, priority)
+        automaton.make_automaton()
+        return kw_priority, automaton, None, None
+
+    if marisa_trie is not None:
+        # Prefix lookups from every offset of the query
+        return kw_priority, None, marisa_trie.Trie(kw_priority), None
+
+    # Zero-width lookahead so overlapping keywords are still found at
+    # every position; alternatives are ordered by category priority.
+    keyword_re = re.compile(
+        '(?=(' + '|'.join(map(re.escape, kw_priority)) + '))',
+        re.IGNORECASE
+    )
+    return kw_priority, None, None, keyword_re
+
+
+_KW_PRIORITY, _AUTOMATON, _KW_TRIE, _KEYWORD_RE = _build_keyword_matcher()
+
+
+@functools.lru_cache(maxsize=1024)
+def _classify_query(query_lower: str) -> str:
+    """Map a lowercased query to its highest-priority category (cached: repeats are common)"""
+    if _AUTOMATON is not None:
+        priorities = (priority for _, priority in _AUTOMATON.iter(query_lower))
+    elif _KW_TRIE is not None:
+        priorities = (
+            _KW_PRIORITY[kw]
+            for i in range(len(query_lower))
+            for kw in _KW_TRIE.iter_prefixes(query_lower[i:])
+        )
+    else:
+        priorities = (_KW_PRIORITY[m.group(1)] for m in _KEYWORD_RE.finditer(query_lower))
+
+    best = None
+    for priority in priorities:
+        if priority == 0:
+            return _QUERY_TYPES[0]  # Highest priority, no need to scan further
+        if best is None or priority < best:
+            best = priority
+
+    if best is None:
+        return 'unknown'  # triggers LLM fallback
+    return _QUERY_TYPES[best]
+
+def _extract_json(text: str) -> Optional[str]:
+    """Return the first balanced {...} object in text (single linear scan).
+
+    Braces inside JSON strings are ignored; quotes are only tracked once an
+    object has started, so apostrophes in surrounding prose don't matter.
+    """
+    depth = 0
+    start = -1
+    in_string = False
+    escaped = False
+
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '{':
+            if depth == 0:
+                start = i
+            depth += 1
+        elif depth > 0:
+            if ch == '"':
+                in_string = True
+            elif ch == '}':
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1]
+
+    return None
+
+
 class Planner:
     """Hybrid Planner: Rule-based first, fallback to LLM if no match"""
 
+    # query type -> plan fields; step tuples are shared by every plan built from them
+    _RULE_PLANS: Dict[str, Dict] = {
+        'weather_check': {
+            'steps': ('Check current weather', 'Analyze if watering is needed', 'Provide recommendation'),
+            'requires_tools': True,
+            'estimated_complexity': 'medium'
+        },
+        'plant_care': {
+            'steps': ('Identify plant', 'Retrieve care knowledge from RAG', 'Provide personalized advice'),
+            'requires_tools': False,
+            'estimated_complexity': 'medium'
+        },
+        'reminder': {
+            'steps': ('Parse schedule details', 'Create reminder', 'Confirm with user'),
+            'requires_tools': True,
+            'estimated_complexity': 'low'
+        },
+        'calculation': {
+            'steps': ('Parse calculation request', 'Execute calculation', 'Explain result'),
+            'requires_tools': True,
+            'estimated_complexity': 'low'
+        },
+        'search': {
+            'steps': ('Search for information', 'Summarize findings', 'Provide answer'),
+            'requires_tools': True,
+            'estimated_complexity': 'medium'
+        },
+    }
+
+    # Plan for trivial input (greetings, very short or non-text queries): no LLM call
+    _TRIVIAL_PLAN: Dict = {
+        'type': 'trivial',
+        'steps': ('Understand user query', 'Generate helpful response'),
+        'requires_tools': False,
+        'estimated_complexity': 'low'
+    }
+    _TRIVIAL_QUERY_LENGTH = 8
+
     def __init__(self):
         try:
             self.llm = ChatGroq(
@@ -31,177 +220,162 @@ class Planner:
             logger.warning(f"Groq LLM not initialized properly: {e}")
             self.llm = None
 
-        self.plan_templates = {
-            'weather_check': ['get_weather', 'analyze_watering_needs'],
-            'plant_care': ['retrieve_plant_knowledge', 'provide_advice'],
-            'reminder': ['parse_schedule', 'set_reminder'],
-            'calculation': ['identify_calculation', 'execute_calculator'],
-            'general': ['understand_query', 'retrieve_context', 'respond']
-        }
+        self._plans_created = 0
 
         logger.info("Hybrid Planner initialized with Groq LLM fallback")
 
     # === MAIN ENTRY POINT ===
     def create_plan(self, query: str, context: str = "") -> Dict:
         """Create a plan based on the query (rule-based first, LLM fallback)"""
-        query_lower = query.lower()
+        plan = self._create_rule_plan(query)
+        if plan is None:
+            # If no match, fallback to LLM-based planner
+            logger.warning(f"No rule matched for query: '{query}' → using LLM planner")
+            plan = self._create_plan_with_llm(query, context)
 
-        # Step 1: Rule-based identification
-        query_type = self._identify_query_type(query_lower)
-        plan = {
-            'query': query,
-            'type': query_type,
-            'steps': [],
-            'requires_tools': False,
-            'estimated_complexity': 'low'
-        }
+        self._log_plan(plan)
+        return plan
 
-        # Step 2: Rule-based plan generation
-        if query_type == 'weather_check':
-            plan['steps'] = [
-                'Check current weather',
-                'Analyze if watering is needed',
-                'Provide recommendation'
-            ]
-            plan['requires_tools'] = True
-            plan['estimated_complexity'] = 'medium'
-
-        elif query_type == 'plant_care':
-            plan['steps'] = [
-                'Identify plant',
-                'Retrieve care knowledge from RAG',
-                'Provide personalized advice'
-            ]
-            plan['requires_tools'] = False
-            plan['estimated_complexity'] = 'medium'
-
-        elif query_type == 'reminder':
-            plan['steps'] = [
-                'Parse schedule details',
-                'Create reminder',
-                'Confirm with user'
-            ]
-            plan['requires_tools'] = True
-            plan['estimated_complexity'] = 'low'
-
-        elif query_type == 'calculation':
-            plan['steps'] = [
-                'Parse calculation request',
-                'Execute calculation',
-                'Explain result'
-            ]
-            plan['requires_tools'] = True
-            plan['estimated_complexity'] = 'low'
-
-        elif query_type == 'search':
-            plan['steps'] = [
-                'Search for information',
-                'Summarize findings',
-                'Provide answer'
+    async def acreate_plan(self, query: str, context: str = "") -> Dict:
+        """Async variant of create_plan (the LLM fallback doesn't block the event loop)"""
+        plan = self._create_rule_plan(query)
+        if plan is None:
+            logger.warning(f"No rule matched for query: '{query}' → using LLM planner")
+            plan = await self._acreate_plan_with_llm(query, context)
+
+        self._log_plan(plan)
+        return plan
+
+    async def acreate_plans(self, queries: List[str], context: str = "") -> List[Dict]:
+        """Plan many queries at once; unmatched ones share one batched LLM call"""
+        plans = [self._create_rule_plan(query) for query in queries]
+        pending = [i for i, plan in enumerate(plans) if plan is None]
+
+        if pending:
+            logger.info(f"No rule matched for {len(pending)} queries → using LLM planner (batched)")
+            prompts = [
+                [HumanMessage(content=self._llm_plan_prompt(queries[i], context))] for i in pending
             ]
-            plan['requires_tools'] = True
-            plan['estimated_complexity'] = 'medium'
+            try:
+                responses = await self.llm.abatch(
+                    prompts, config={"max_concurrency": 10}, return_exceptions=True
+                )
+            except Exception as e:
+                logger.error(f"Batched LLM planning failed: {e}")
+                responses = [e] * len(pending)
 
-        else:
-            # Step 3: If no match, fallback to LLM-based planner
-            logger.warning(f"No rule matched for query: '{query}' → using LLM planner")
-            plan = self._create_plan_with_llm(query, context)
+            for i, response in zip(pending, responses):
+                # One failed item falls back on its own without failing the batch
+                try:
+                    if isinstance(response, Exception):
+                        raise response
+                    plans[i] = self._parse_llm_plan(queries[i], response.content)
+                except Exception as e:
+                    logger.error(f"LLM planning failed: {e}")
+                    plans[i] = self._fallback_plan(queries[i])
+
+        for plan in plans:
+            self._log_plan(plan)
+        return plans
 
+    def _create_rule_plan(self, query: str) -> Optional[Dict]:
+        """Rule-based plan from the query-type table (None if no rule matches)"""
+        # Step 1: Rule-based identification
+        query_type = self._identify_query_type(query)
+        template = self._RULE_PLANS.get(query_type)
+        if template is None:
+            if self._is_trivial_query(query):
+                return {'query': query, **self._TRIVIAL_PLAN}
+            return None
+
+        # Step 2: Rule-based plan generation (table lookup, one dict merge)
+        return {'query': query, 'type': query_type, **template}
+
+    def requires_tools(self, query: str) -> bool:
+        """Whether the rule-based plan for a query depends on live tool output"""
+        plan = self._create_rule_plan(query)
+        return plan is not None and plan['requires_tools']
+
+    def _is_trivial_query(self, query: str) -> bool:
+        """Too short or no letters at all: not worth an LLM planning round-trip"""
+        return (len(query.strip()) < self._TRIVIAL_QUERY_LENGTH
+                or not any(c.isalpha() for c in query))
+
+    def _log_plan(self, plan: Dict):
+        """Debug-log a plan and periodically report classification cache stats"""
         logger.debug(f"Plan created for query type '{plan['type']}': {plan['steps']}")
-        return plan
+
+        self._plans_created += 1
+        if self._plans_created % 500 == 0:
+            logger.info(f"Query type cache: {_classify_query.cache_info()}")
 
     # === RULE-BASED DETECTION ===
-    def _identify_query_type(self, query: str) -> str:
+    @staticmethod
+    def _identify_query_type(query: str) -> str:
         """Identify query type (supports both English and Indonesian keywords)"""
-
-        weather_keywords = [
-            'weather', 'rain', 'temperature', 'forecast', 'should i water',
-            'cuaca', 'hujan', 'suhu', 'prakiraan', 'apakah perlu menyiram'
-        ]
-        plant_care_keywords = [
-            'how to', 'care for', 'grow', 'plant', 'sunlight',
-            'cara merawat', 'tanam', 'menyiram', 'pupuk', 'tanaman'
-        ]
-        reminder_keywords = [
-            'remind', 'schedule', 'set reminder', 'notify',
-            'ingatkan', 'jadwal', 'pengingat', 'buat pengingat'
-        ]
-        calculation_keywords = [
-            'calculate', 'how much', 'how many', 'liters', 'gallons',
-            'hitung', 'berapa', 'jumlah', 'liter', 'galon'
-        ]
-        search_keywords = [
-            'search', 'find', 'look up', 'information about',
-            'cari', 'temukan', 'informasi tentang'
-        ]
-
-        if any(kw in query for kw in weather_keywords):
-            return 'weather_check'
-        elif any(kw in query for kw in reminder_keywords):
-            return 'reminder'
-        elif any(kw in query for kw in calculation_keywords):
-            return 'calculation'
-        elif any(kw in query for kw in search_keywords):
-            return 'search'
-        elif any(kw in query for kw in plant_care_keywords):
-            return 'plant_care'
-        else:
-            return 'unknown'  # triggers LLM fallback
+        return _classify_query(query.lower())
 
     # === LLM FALLBACK ===
     def _create_plan_with_llm(self, query: str, context: str = "") -> Dict:
         """Use Groq LLM to dynamically plan when rule-based match fails"""
-        prompt = f"""
-        You are a planning assistant for a smart chatbot.
-        The user asked: "{query}"
-        Context: {context}
-
-        Your task:
-        1. Understand the user's intent (in any language).
-        2. Break the goal into 3-5 short, actionable steps.
-        3. Return the plan in JSON format with these fields:
-        - type: short label of the task
-        - steps: list of steps
-        - requires_tools: true/false
-        - estimated_complexity: low/medium/high
-        """
-
         try:
-            response = self.llm.invoke([HumanMessage(content=prompt)])
-            text = response.content.strip()
-
-            # Basic safe parse (expecting JSON-like)
-            import json, re
-            match = re.search(r"\{.*\}", text, re.DOTALL)
-            if match:
-                parsed = json.loads(match.group(0))
-                parsed['query'] = query
-                logger.info("Plan successfully generated by LLM")
-                return parsed
-            else:
-                logger.warning("LLM did not return valid JSON, using fallback format")
-                return {
-                    'query': query,
-                    'type': 'llm_generated',
-                    'steps': [line.strip("- ") for line in text.split("\n") if line.strip()],
-                    'requires_tools': False,
-                    'estimated_complexity': 'medium'
-                }
+            response = self.llm.invoke([HumanMessage(content=self._llm_plan_prompt(query, context))])
+            return self._parse_llm_plan(query, response.content)
+        except Exception as e:
+            logger.error(f"LLM planning failed: {e}")
+            return self._fallback_plan(query)
 
+    async def _acreate_plan_with_llm(self, query: str, context: str = "") -> Dict:
+        """Async variant of _create_plan_with_llm"""
+        try:
+            response = await self.llm.ainvoke(
+                [HumanMessage(content=self._llm_plan_prompt(query, context))]
+            )
+            return self._parse_llm_plan(query, response.content)
         except Exception as e:
             logger.error(f"LLM planning failed: {e}")
+            return self._fallback_plan(query)
+
+    def _llm_plan_prompt(self, query: str, context: str) -> str:
+        """Prompt asking the LLM for a JSON plan"""
+        return _LLM_PROMPT_TEMPLATE.format(query=query, context=context)
+
+    def _parse_llm_plan(self, query: str, content: str) -> Dict:
+        """Parse the LLM planner response into a plan dict"""
+        text = content.strip()
+
+        # Basic safe parse (expecting JSON-like)
+        json_text = _extract_json(text)
+        if json_text is not None:
+            parsed = _json_loads(json_text)
+            parsed['query'] = query
+            logger.info("Plan successfully generated by LLM")
+            return parsed
+        else:
+            logger.warning("LLM did not return valid JSON, using fallback format")
             return {
                 'query': query,
-                'type': 'fallback_general',
-                'steps': ['Understand user query', 'Check memory/context', 'Generate helpful response'],
+                'type': 'llm_generated',
+                'steps': [line.strip("- ") for line in text.split("\n") if line.strip()],
                 'requires_tools': False,
-                'estimated_complexity': 'low'
+                'estimated_complexity': 'medium'
             }
 
+    def _fallback_plan(self, query: str) -> Dict:
+        """Generic plan used when the LLM planner is unavailable"""
+        return {
+            'query': query,
+            'type': 'fallback_general',
+            'steps': ['Understand user query', 'Check memory/context', 'Generate helpful response'],
+            'requires_tools': False,
+            'estimated_complexity': 'low'
+        }
+
     # === PLAN ADJUSTMENT ===
     def adjust_plan(self, plan: Dict, feedback: str) -> Dict:
         """Adjust plan based on feedback or errors"""
         if 'error' in feedback.lower() or 'failed' in feedback.lower():
-            plan['steps'].append('Retry with alternative approach')
+            # Rule plans share immutable step tuples, so build a new list
+            plan['steps'] = [*plan['steps'], 'Retry with alternative approach']
             plan['estimated_complexity'] = 'high'
         return plan
\ No newline at end of file
@@ -3,14 +3,113 @@ Tool Manager
 Implements various tools: Weather, Calculator, Reminder, Search, and Reminder Clearing
 """
 import os
+import re
+import ast
 import json
+import math
+import shutil
+import atexit
+import operator
+import asyncio
 import logging
+import functools
+import threading
+import weakref
+from contextlib import contextmanager
+import httpx
 import requests
-from typing import Any, Dict, List
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cachetools import TTLCache
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib json module
+    orjson = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 logger = logging.getLogger(__name__)
 
+WEATHER_API_URL = "http://api.openweathermap.org/data/2.5/weather"
+
+# OpenWeatherMap condition groups (id // 100): 2xx thunderstorm, 3xx drizzle, 5xx rain
+_RAIN_CONDITION_GROUPS = frozenset({2, 3, 5})
+
+# Arithmetic the calculator evaluates (everything else is rejected structurally)
+_CALC_BINOPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Pow: operator.pow,
+}
+_CALC_UNARYOPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+# Upper bound on the size of a power's result, checked before computing it, so
+# "9**9**9" or nested "((9**99)**99)**99" can't hang the worker
+_CALC_MAX_RESULT_BITS = 10_000
+# Whole-input match of the allowed calculator characters (one C-level scan)
+_SAFE_CALC = re.compile(r'\A[0-9+\-*/(). ]+\Z')
+
+
+@functools.lru_cache(maxsize=512)
+def _parse_calculation(expression: str) -> ast.Expression:
+    """Parse an arithmetic expression once; repeated expressions reuse the tree"""
+    return ast.parse(expression, mode='eval')
+
+
+@contextmanager
+def _file_lock(lock_path: str):
+    """Exclusive inter-process lock held on a sidecar lock file"""
+    with open(lock_path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _json_loads(data: bytes):
+    """Parse JSON bytes (orjson when available)"""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _json_dumps(obj) -> bytes:
+    """Serialize to single-line JSON bytes (orjson when available)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+# Managers with possibly buffered reminders; weak so registering doesn't keep them alive
+_live_managers: "weakref.WeakSet[ToolManager]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all():
+    """Write every live manager's buffered reminders at interpreter exit"""
+    for manager in list(_live_managers):
+        manager.flush()
+
+
 class ToolManager:
     """Manages and executes various tools for Garden Advisor"""
 
@@ -21,40 +120,166 @@ class ToolManager:
             'reminder': self.set_reminder,
             'search': self.search_web
         }
+        # Tools with native async implementations (others run in a worker thread)
+        self.async_tools = {
+            'weather': self.aget_weather
+        }
+        self._http: Optional[httpx.AsyncClient] = None
+        self._http_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing: set = set()  # pending aclose() tasks (the loop keeps only weak refs)
+
+        # Pooled keep-alive session for the blocking tools (reuses TCP/TLS setup)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=10, pool_maxsize=20,
+            max_retries=Retry(total=2, backoff_factor=0.2)
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({'Accept-Encoding': 'gzip'})
+
+        # Weather changes on a ~10 minute scale: reuse recent reports per location
+        self._weather_cache = TTLCache(maxsize=512, ttl=600)
+        self._weather_lock = threading.Lock()
+
+        # === Settings (read once; the environment is loaded before tools are built) ===
+        self.weather_api_key = os.getenv('WEATHER_API_KEY')
+        self.search_enabled = os.getenv('DUCKDUCKGO_SEARCH_ENABLED', 'false').lower() == 'true'
 
         # === Reminder setup ===
-        self.reminder_file = os.getenv('REMINDER_FILE', './data/reminders.json')
+        # JSON lines: one reminder record per line, so adding one is a single append
+        self.reminder_file = os.getenv('REMINDER_FILE', './data/reminders.jsonl')
         os.makedirs(os.path.dirname(self.reminder_file), exist_ok=True)
+        # Other processes may share the file: every read-modify-write holds this lock.
+        # (A sidecar file, so compaction can still replace the data file atomically.)
+        self._reminder_lock_file = self.reminder_file + '.lock'
 
         if not os.path.exists(self.reminder_file):
-            with open(self.reminder_file, 'w') as f:
-                json.dump({}, f)
+            self._create_reminder_file()
 
-        # Optional in-memory cache for performance
+        # In-memory cache is the source of truth; the file is only written on change.
+        # Tools run in worker threads, so updates are serialized with a lock.
         self._reminder_cache = self._load_reminders()
+        self._reminder_lock = threading.Lock()
+
+        # New records can be buffered and appended in one write per flush (when the
+        # buffer fills, on clear, and at exit). Buffered records are lost if the
+        # process dies without exiting cleanly, so the default is write-through.
+        self.reminder_flush_size = max(1, int(os.getenv('REMINDER_FLUSH_SIZE', '1')))
+        self._pending_reminders: List[bytes] = []
+        _live_managers.add(self)
 
         logger.info("Tool Manager initialized successfully")
 
     # ======================================================
     # === Helper functions for reminders file handling ===
     # ======================================================
+    def _create_reminder_file(self):
+        """Create the reminder file, seeding it from the old reminders.json if one exists"""
+        root, ext = os.path.splitext(self.reminder_file)
+        legacy_file = root + '.json'
+        with _file_lock(self._reminder_lock_file):
+            if os.path.exists(self.reminder_file):
+                return
+            if ext == '.jsonl' and os.path.exists(legacy_file):
+                # Upgrade from the JSON document default: _read_reminders migrates the
+                # copy, and the old file is left in place as a backup
+                logger.info(f"Migrating reminders from {legacy_file}")
+                shutil.copyfile(legacy_file, self.reminder_file)
+            else:
+                open(self.reminder_file, 'wb').close()
+
     def _load_reminders(self) -> Dict[str, List[Dict]]:
-        """Load reminders from JSON file safely"""
+        """Load reminders from the JSON-lines file (migrating the old JSON dict format)"""
+        with _file_lock(self._reminder_lock_file):
+            return self._read_reminders()
+
+    def _read_reminders(self) -> Dict[str, List[Dict]]:
+        """Parse the reminder file, rewriting it if needed (caller holds the file lock)"""
         try:
-            with open(self.reminder_file, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            logger.warning("Reminder file empty or corrupted — resetting.")
+            with open(self.reminder_file, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
             return {}
         except Exception as e:
             logger.error(f"Error loading reminders: {e}")
             return {}
 
+        legacy = self._parse_legacy_reminders(data)
+        if legacy is not None:
+            logger.info("Migrating reminder file to JSON lines")
+            self._save_reminders(legacy)
+            return legacy
+
+        reminders: Dict[str, List[Dict]] = {}
+        corrupted = False
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = _json_loads(line)
+                user_id = record.pop('user_id')
+            except (ValueError, KeyError, AttributeError):  # incl. JSONDecodeError
+                logger.warning("Skipping corrupted reminder record")
+                corrupted = True
+                continue
+            reminders.setdefault(user_id, []).append(record)
+
+        if corrupted:
+            # Drop the bad lines (e.g. a torn append) so new records start on a clean line
+            self._save_reminders(reminders)
+        return reminders
+
+    def _parse_legacy_reminders(self, data: bytes):
+        """Return the reminders if data is the old {user_id: [reminder, ...]} document"""
+        try:
+            parsed = _json_loads(data)
+        except ValueError:  # JSON lines (several documents) or empty file
+            return None
+        if isinstance(parsed, dict) and all(isinstance(v, list) for v in parsed.values()):
+            return parsed
+        return None
+
+    def _append_reminder(self, user_id: str, reminder: Dict):
+        """Buffer one reminder record for the file (caller holds the reminder lock)"""
+        self._pending_reminders.append(_json_dumps({'user_id': user_id, **reminder}) + b'\n')
+        if len(self._pending_reminders) >= self.reminder_flush_size:
+            self._flush_pending()
+
+    def _flush_pending(self):
+        """Append every buffered record in one write (caller holds the reminder lock)"""
+        if self._pending_reminders:
+            with _file_lock(self._reminder_lock_file):
+                self._write_pending()
+
+    def _write_pending(self):
+        """Write the buffered records (caller holds the reminder and file locks)"""
+        with open(self.reminder_file, 'ab') as f:
+            f.write(b''.join(self._pending_reminders))
+        self._pending_reminders.clear()
+
+    def flush(self):
+        """Write buffered reminders to the file"""
+        try:
+            with self._reminder_lock:
+                self._flush_pending()
+        except Exception as e:
+            logger.error(f"Failed to flush reminders: {e}")
+
     def _save_reminders(self, reminders: Dict[str, List[Dict]]):
-        """Save reminders to JSON file safely"""
+        """Rewrite (compact) the whole reminder file atomically (temp file, then replace).
+
+        Callers hold the file lock.
+        """
+        tmp_file = self.reminder_file + '.tmp'
         try:
-            with open(self.reminder_file, 'w') as f:
-                json.dump(reminders, f, indent=2)
+            with open(tmp_file, 'wb') as f:
+                f.writelines(
+                    _json_dumps({'user_id': user_id, **reminder}) + b'\n'
+                    for user_id, user_reminders in reminders.items()
+                    for reminder in user_reminders
+                )
+            os.replace(tmp_file, self.reminder_file)
         except Exception as e:
             logger.error(f"Failed to save reminders: {e}")
 
@@ -94,46 +319,82 @@ class ToolManager:
             logger.error(f"Tool '{tool_name}' execution failed: {e}", exc_info=True)
             return f"Tool execution failed: {str(e)}"
 
+    async def aexecute_tool(self, tool_name: str, params: str, user_id: str = None) -> str:
+        """Async variant of execute_tool (blocking tools run in a worker thread)"""
+        tool_name = tool_name.lower().strip()
+
+        if tool_name not in self.tools:
+            return f"Unknown tool: {tool_name}"
+
+        try:
+            logger.info(f"Executing tool: {tool_name} with params: {params}")
+            if tool_name in self.async_tools:
+                return await self.async_tools[tool_name](params, user_id)
+            return await asyncio.to_thread(self.tools[tool_name], params, user_id)
+        except Exception as e:
+            logger.error(f"Tool '{tool_name}' execution failed: {e}", exc_info=True)
+            return f"Tool execution failed: {str(e)}"
+
+    def _get_http(self) -> httpx.AsyncClient:
+        """Shared async HTTP client for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._http_loop is not loop:
+            self._close_http()
+            self._http = httpx.AsyncClient(timeout=10)
+            self._http_loop = loop
+        return self._http
+
+    def _close_http(self):
+        """Close the async HTTP client on the event loop it was created on"""
+        client, loop = self._http, self._http_loop
+        self._http = self._http_loop = None
+        if client is None or loop.is_closed():
+            # Its connections died with the loop and can't be closed from another one
+            return
+        if loop.is_running():
+            try:
+                current = asyncio.get_running_loop()
+            except RuntimeError:
+                current = None
+            if loop is current:
+                task = loop.create_task(client.aclose())
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+            else:
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            return
+        # Idle loop: run it just long enough to close the client (off this thread,
+        # which may be running a loop of its own)
+        closer = threading.Thread(target=loop.run_until_complete, args=(client.aclose(),))
+        closer.start()
+        closer.join()
+
+    def cleanup(self):
+        """Write buffered reminders and close the HTTP clients"""
+        self.flush()
+        self._close_http()
+        self._session.close()
+
     # ======================================================
     # === Tool Implementations ===
     # ======================================================
     def get_weather(self, location: str, user_id: str = None) -> str:
         """Fetch weather data from OpenWeatherMap"""
-        api_key = os.getenv('WEATHER_API_KEY')
+        api_key = self.weather_api_key
         if not api_key:
             return "Weather API key not configured. Please set WEATHER_API_KEY in .env."
 
+        cache_key = location.strip().lower()
+        cached = self._get_cached_weather(cache_key)
+        if cached is not None:
+            return cached
+
         try:
-            url = "http://api.openweathermap.org/data/2.5/weather"
             params = {'q': location.strip(), 'appid': api_key, 'units': 'metric'}
 
-            response = requests.get(url, params=params, timeout=10)
+            response = self._session.get(WEATHER_API_URL, params=params, timeout=10)
             response.raise_for_status()
-            data = response.json()
-
-            temp = data['main']['temp']
-            feels_like = data['main']['feels_like']
-            humidity = data['main']['humidity']
-            description = data['weather'][0]['description']
-            wind_speed = data['wind']['speed']
-
-            result = (
-                f"**Weather in {location.title()}**\n"
-                f"• Temperature: {temp}°C (feels like {feels_like}°C)\n"
-                f"• Conditions: {description}\n"
-                f"• Humidity: {humidity}%\n"
-                f"• Wind Speed: {wind_speed} m/s\n\n"
-            )
-
-            # Add contextual watering suggestion
-            if humidity < 40 or temp > 30:
-                result += "It's quite dry/hot — consider extra watering."
-            elif any(x in description.lower() for x in ['rain', 'drizzle', 'thunderstorm']):
-                result += "Rain expected — you can skip watering today."
-            else:
-                result += "Conditions are fine for regular watering."
-
-            return result
+            return self._cache_weather(cache_key, self._format_weather(location, response.json()))
 
         except requests.exceptions.RequestException as e:
             logger.error(f"Weather API error: {e}")
@@ -141,37 +402,112 @@ class ToolManager:
         except KeyError:
             return "Unexpected weather data format."
 
+    async def aget_weather(self, location: str, user_id: str = None) -> str:
+        """Async variant of get_weather (non-blocking HTTP request)"""
+        api_key = self.weather_api_key
+        if not api_key:
+            return "Weather API key not configured. Please set WEATHER_API_KEY in .env."
+
+        cache_key = location.strip().lower()
+        cached = self._get_cached_weather(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            params = {'q': location.strip(), 'appid': api_key, 'units': 'metric'}
+
+            response = await self._get_http().get(WEATHER_API_URL, params=params)
+            response.raise_for_status()
+            return self._cache_weather(cache_key, self._format_weather(location, response.json()))
+
+        except (httpx.HTTPError, ValueError) as e:  # ValueError: non-JSON body, as in get_weather
+            logger.error(f"Weather API error: {e}")
+            return f"Unable to retrieve weather for '{location}'."
+        except KeyError:
+            return "Unexpected weather data format."
+
+    def _get_cached_weather(self, key: str) -> Optional[str]:
+        """Return a recent weather report for a location, if any"""
+        with self._weather_lock:
+            return self._weather_cache.get(key)
+
+    def _cache_weather(self, key: str, result: str) -> str:
+        """Remember a successful weather report (errors are never cached)"""
+        with self._weather_lock:
+            self._weather_cache[key] = result
+        return result
+
+    def _format_weather(self, location: str, data: Dict) -> str:
+        """Format an OpenWeatherMap response with a watering suggestion"""
+        temp = data['main']['temp']
+        feels_like = data['main']['feels_like']
+        humidity = data['main']['humidity']
+        description = data['weather'][0]['description']
+        condition_id = data['weather'][0]['id']
+        wind_speed = data['wind']['speed']
+
+        result = (
+            f"**Weather in {location.title()}**\n"
+            f"• Temperature: {temp}°C (feels like {feels_like}°C)\n"
+            f"• Conditions: {description}\n"
+            f"• Humidity: {humidity}%\n"
+            f"• Wind Speed: {wind_speed} m/s\n\n"
+        )
+
+        # Add contextual watering suggestion
+        if humidity < 40 or temp > 30:
+            result += "It's quite dry/hot — consider extra watering."
+        elif condition_id // 100 in _RAIN_CONDITION_GROUPS:
+            result += "Rain expected — you can skip watering today."
+        else:
+            result += "Conditions are fine for regular watering."
+
+        return result
+
     def calculate(self, expression: str, user_id: str = None) -> str:
         """Perform a safe arithmetic calculation"""
         try:
-            allowed_chars = set("0123456789+-*/(). ")
-            if not all(c in allowed_chars for c in expression):
+            if not _SAFE_CALC.match(expression):
                 return "Invalid expression. Use only numbers and +, -, *, /, (, )."
 
-            result = eval(expression)
+            result = self._eval_ast(_parse_calculation(expression.strip()))
             logger.info(f"Calculation performed: {expression} = {result}")
             return f"Result: `{result}`"
         except Exception as e:
             logger.error(f"Calculation error: {e}")
             return f"Calculation error: {str(e)}"
 
+    def _eval_ast(self, node):
+        """Evaluate a parsed arithmetic expression (numbers and + - * / ** only)"""
+        if isinstance(node, ast.Expression):
+            return self._eval_ast(node.body)
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return node.value
+        if isinstance(node, ast.BinOp) and type(node.op) in _CALC_BINOPS:
+            left, right = self._eval_ast(node.left), self._eval_ast(node.right)
+            if (isinstance(node.op, ast.Pow) and abs(left) > 1
+                    and abs(right) * math.log2(abs(left)) > _CALC_MAX_RESULT_BITS):
+                raise ValueError("result too large")
+            return _CALC_BINOPS[type(node.op)](left, right)
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _CALC_UNARYOPS:
+            return _CALC_UNARYOPS[type(node.op)](self._eval_ast(node.operand))
+        raise ValueError("unsupported expression")
+
     def set_reminder(self, schedule: str, user_id: str = None) -> str:
         """Set a watering reminder for the user"""
         if not user_id:
             return "User ID required to set reminders."
 
         try:
-            reminders = self._load_reminders()
-
             reminder = {
                 'schedule': schedule.strip(),
                 'created_at': datetime.now().isoformat(),
                 'active': True
             }
 
-            reminders.setdefault(user_id, []).append(reminder)
-            self._save_reminders(reminders)
-            self._reminder_cache = reminders  # update in-memory cache
+            with self._reminder_lock:
+                self._append_reminder(user_id, reminder)
+                self._reminder_cache.setdefault(user_id, []).append(reminder)
 
             logger.info(f"Reminder set for user {user_id}: {schedule}")
             return f"Reminder set: **{schedule}**"
@@ -181,7 +517,7 @@ class ToolManager:
 
     def search_web(self, query: str, user_id: str = None) -> str:
         """Search the web for plant info using DuckDuckGo"""
-        if os.getenv('DUCKDUCKGO_SEARCH_ENABLED', 'false').lower() != 'true':
+        if not self.search_enabled:
             return "Web search is disabled. Enable `DUCKDUCKGO_SEARCH_ENABLED=true` in .env."
 
         try:
@@ -212,8 +548,8 @@ class ToolManager:
     def get_user_reminders(self, user_id: str) -> List[Dict[str, Any]]:
         """Return all reminders for a user"""
         try:
-            reminders = self._load_reminders()
-            return reminders.get(user_id, [])
+            with self._reminder_lock:
+                return list(self._reminder_cache.get(user_id, []))
         except Exception as e:
             logger.error(f"Failed to get reminders: {e}")
             return []
@@ -221,8 +557,8 @@ class ToolManager:
     def get_all_users(self) -> List[str]:
         """Return list of all users who have reminders"""
         try:
-            reminders = self._load_reminders()
-            return list(reminders.keys())
+            with self._reminder_lock:
+                return list(self._reminder_cache.keys())
         except Exception as e:
             logger.error(f"Error getting all users: {e}")
             return []
@@ -230,11 +566,30 @@ class ToolManager:
     def clear_user_reminders(self, user_id: str):
         """Delete all reminders for a given user"""
         try:
-            reminders = self._load_reminders()
-            if user_id in reminders:
-                del reminders[user_id]
-                self._save_reminders(reminders)
+            with self._reminder_lock, _file_lock(self._reminder_lock_file):
+                if self._pending_reminders:
+                    self._write_pending()
+                # Re-read under the lock so records appended by other processes survive
+                reminders = self._read_reminders()
                 self._reminder_cache = reminders
+                if reminders.pop(user_id, None) is None:
+                    return
+                # Compact the file without the user's records
+                self._save_reminders(reminders)
                 logger.info(f"Cleared all reminders for user {user_id}")
         except Exception as e:
             logger.error(f"Failed to clear reminders for user {user_id}: {e}")
+
+
+_tool_manager: Optional[ToolManager] = None
+_tool_manager_lock = threading.Lock()
+
+
+def get_tool_manager() -> ToolManager:
+    """Return the process-wide ToolManager (created on first use)"""
+    # One instance means one reminder cache, weather cache and HTTP pool
+    global _tool_manager
+    with _tool_manager_lock:
+        if _tool_manager is None:
+            _tool_manager = ToolManager()
+        return _tool_manager
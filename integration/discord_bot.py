@@ -3,11 +3,18 @@ Discord Bot Integration
 Connects the Garden Advisor Agent to Discord
 """
 import os
+import re
+import asyncio
 import logging
+import time
+from collections import defaultdict, deque
+from typing import AsyncIterator, Iterator, Optional
 import discord
+from cachetools import TTLCache
 from discord.ext import commands
 
-from core.agent import GardenAdvisorAgent
+from core.agent import ERROR_RESPONSES, GardenAdvisorAgent
+from core.cache import SemanticCache
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +25,38 @@ intents.messages = True
 intents.members = True  # dibutuhkan agar bisa kirim DM ke user
 
 bot = commands.Bot(command_prefix='!', intents=intents)
+# Created on first use by _get_agent (ChromaDB, embedding model and LLM clients)
 agent = None
+response_cache = None
+_agent_lock = asyncio.Lock()
+_warmup_task = None
+_commands_synced = False
+# Matches both <@ID> and nickname <@!ID> mentions of the bot, compiled in on_ready
+_mention_re = None
+
+STARTUP_MESSAGE = "Starting up, please retry in a moment 🌱"
+
+# Add to a message to skip the semantic response cache
+NOCACHE_FLAG = '!nocache'
+
+DISCORD_MESSAGE_LIMIT = 2000
+# Replies go out as embeds: 4096-character descriptions, minus some headroom
+EMBED_DESCRIPTION_LIMIT = 4000
+# Preferred split points for long replies, best first
+_SPLIT_SEPARATORS = ('\n\n', '\n', '. ', ' ')
+CHUNK_SEND_DELAY = 0.25
+# Streamed replies: placeholder text, and seconds between edits of the growing message
+STREAM_PLACEHOLDER = "…"
+STREAM_EDIT_INTERVAL = 1.0
+
+# Outbound sends per channel within a sliding window, kept below Discord's 429 threshold
+CHANNEL_SEND_LIMIT = 30
+CHANNEL_SEND_WINDOW = 60.0
+_channel_send_locks = defaultdict(asyncio.Lock)
+_channel_send_times = defaultdict(deque)
+
+# user_id -> plants from long-term memory; dropped whenever the user's memory changes
+_plants_cache = TTLCache(maxsize=1024, ttl=30)
 
 
 # =====================
@@ -27,8 +65,18 @@ agent = None
 @bot.event
 async def on_ready():
     """Called when bot is ready"""
-    global agent
-    agent = GardenAdvisorAgent()
+    global _mention_re, _commands_synced, _warmup_task
+    _mention_re = re.compile(rf'<@!?{bot.user.id}>')
+
+    # on_ready fires again on reconnect; slash commands only need one sync
+    if not _commands_synced:
+        synced = await bot.tree.sync()
+        _commands_synced = True
+        logger.info(f"Synced {len(synced)} slash commands")
+
+    # Build the agent in the background so the bot is online right away
+    if agent is None and _warmup_task is None:
+        _warmup_task = asyncio.create_task(_warm_up_agent())
 
     logger.info(f'Bot logged in as {bot.user.name} (ID: {bot.user.id})')
     print(f'🌿 Garden Advisor Bot is ready!')
@@ -36,6 +84,37 @@ async def on_ready():
     print(f'Ready to help with garden advice!')
 
 
+async def _get_agent() -> GardenAdvisorAgent:
+    """Return the shared agent, building it off the event loop on first use"""
+    global agent, response_cache
+    if agent is None:
+        async with _agent_lock:
+            if agent is None:
+                response_cache = SemanticCache()
+                agent = await asyncio.to_thread(GardenAdvisorAgent)
+                logger.info("Garden Advisor Agent initialized")
+    return agent
+
+
+def _starting_up() -> bool:
+    """True until on_ready has run and the agent warm-up has finished.
+
+    A failed warm-up counts as finished: the next caller of _get_agent retries it.
+    """
+    return _mention_re is None or (
+        agent is None and _warmup_task is not None and not _warmup_task.done()
+    )
+
+
+async def _warm_up_agent():
+    """Create the agent ahead of the first message"""
+    try:
+        await _get_agent()
+    except Exception as e:
+        # Not fatal: the first message retries the initialization
+        logger.error(f"Agent warm-up failed: {e}", exc_info=True)
+
+
 # =====================
 # EVENT: ON MESSAGE
 # =====================
@@ -49,45 +128,150 @@ async def on_message(message):
     
     # Handle direct mentions or DMs
     if bot.user.mentioned_in(message) or isinstance(message.channel, discord.DMChannel):
+        if _starting_up():
+            await _rate_limited_send(message.channel, STARTUP_MESSAGE)
+            return
+
         async with message.channel.typing():
-            content = message.content.replace(f'<@{bot.user.id}>', '').strip()
+            content = _mention_re.sub('', message.content).strip()
+            use_cache = NOCACHE_FLAG not in content
+            content = content.replace(NOCACHE_FLAG, '').strip()
             
             if not content:
-                await message.channel.send("Hi! I'm your Garden Advisor. Ask me anything about plant care! 🌱")
+                await _rate_limited_send(message.channel, "Hi! I'm your Garden Advisor. Ask me anything about plant care! 🌱")
                 return
             
             user_id = str(message.author.id)
             try:
-                response = agent.process_message(user_id, content)
-                
-                if len(response) > 2000:
-                    chunks = [response[i:i+2000] for i in range(0, len(response), 2000)]
-                    for chunk in chunks:
-                        await message.channel.send(chunk)
-                else:
-                    await message.channel.send(response)
+                agent = await _get_agent()
+                # Answers built from live tool output (weather, reminders...) are never reused
+                use_cache = use_cache and not agent.planner.requires_tools(content)
+                if use_cache:
+                    # Embedding is memoized, so process_message reuses it on a miss
+                    query_embedding = await asyncio.to_thread(
+                        agent.memory_manager.embed_query, content
+                    )
+                    cached = response_cache.get(user_id, query_embedding)
+                    if cached is not None:
+                        await _send_response(message.channel, cached)
+                        logger.info(f"Responded to {message.author.name} from cache: {content[:50]}")
+                        return
+
+                response = await _stream_response(
+                    message.channel, agent.process_message_stream(user_id, content)
+                )
+                # The exchange may have mentioned new plants
+                _plants_cache.pop(user_id, None)
+                # Only reached for complete answers: a broken stream raises above
+                if use_cache and response not in ERROR_RESPONSES:
+                    response_cache.set(user_id, query_embedding, response)
                 
                 logger.info(f"Responded to {message.author.name}: {content[:50]}")
             except Exception as e:
                 logger.error(f"Error processing message: {e}", exc_info=True)
-                await message.channel.send("Sorry, I encountered an error. Please try again.")
+                await _rate_limited_send(message.channel, "Sorry, I encountered an error. Please try again.")
+
+
+def _split_point(text: str, limit: int) -> int:
+    """Where to cut text so the first part fits in limit characters"""
+    for separator in _SPLIT_SEPARATORS:
+        cut = text.rfind(separator, 0, limit)
+        if cut > 0:
+            return cut + len(separator)
+    return limit
+
+
+def _split_message(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> Iterator[str]:
+    """Yield chunks of at most limit characters, cut at the last paragraph,
+    line, sentence or word boundary that fits (hard cut only as a last resort)"""
+    start = 0
+    while len(text) - start > limit:
+        end = start + _split_point(text[start:start + limit], limit)
+        chunk = text[start:end].strip()
+        if chunk:
+            yield chunk
+        start = end
+
+    chunk = text[start:].strip()
+    if chunk:
+        yield chunk
+
+
+async def _send_response(channel, response: str):
+    """Send a response as embeds, split to fit the embed description limit.
+
+    One embed per message: a message's embeds share a 6000-character total,
+    so two near-full chunks can never go out together.
+    """
+    for i, chunk in enumerate(_split_message(response, EMBED_DESCRIPTION_LIMIT)):
+        if i:
+            # Space out multi-part replies to stay clear of Discord's rate limit
+            await asyncio.sleep(CHUNK_SEND_DELAY)
+        await _rate_limited_send(channel, embed=discord.Embed(description=chunk))
+
+
+async def _rate_limited_send(channel, content: Optional[str] = None, **kwargs):
+    """Send to a channel, waiting for a free slot once CHANNEL_SEND_LIMIT
+    messages went out in the last CHANNEL_SEND_WINDOW seconds"""
+    sent = _channel_send_times[channel.id]
+    # Serialize sends per channel so concurrent replies share one budget
+    async with _channel_send_locks[channel.id]:
+        now = time.monotonic()
+        while sent and now - sent[0] >= CHANNEL_SEND_WINDOW:
+            sent.popleft()
+
+        if len(sent) >= CHANNEL_SEND_LIMIT:
+            await asyncio.sleep(CHANNEL_SEND_WINDOW - (now - sent[0]))
+            sent.popleft()
+
+        sent_message = await channel.send(content, **kwargs)
+        sent.append(time.monotonic())
+    return sent_message
+
+
+async def _stream_response(channel, deltas: AsyncIterator[str]) -> str:
+    """Show a reply while it is generated by editing a placeholder embed about
+    once per STREAM_EDIT_INTERVAL; a full embed is frozen at its last boundary
+    and the rest continues in a new message. Returns the complete reply; an
+    interrupted stream re-raises its error, so partial replies are never cached."""
+    parts = []
+    text = ""
+    reply = await _rate_limited_send(channel, embed=discord.Embed(description=STREAM_PLACEHOLDER))
+    last_edit = time.monotonic()
+
+    try:
+        async for delta in deltas:
+            parts.append(delta)
+            text += delta
+            while len(text) > EMBED_DESCRIPTION_LIMIT:
+                cut = _split_point(text, EMBED_DESCRIPTION_LIMIT)
+                await reply.edit(embed=discord.Embed(description=text[:cut].strip()))
+                text = text[cut:]
+                reply = await _rate_limited_send(
+                    channel, embed=discord.Embed(description=text.strip() or STREAM_PLACEHOLDER)
+                )
+                last_edit = time.monotonic()
+
+            if text.strip() and time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL:
+                await reply.edit(embed=discord.Embed(description=text.strip()))
+                last_edit = time.monotonic()
+    finally:
+        # Also on a broken stream, so the partial text is flushed before the error
+        await reply.edit(embed=discord.Embed(description=text.strip() or STREAM_PLACEHOLDER))
+    return "".join(parts).strip()
 
 
 # =====================
 # COMMANDS
 # =====================
 
-@bot.command(name='helpme')
-async def help_command(ctx):
-    """Show help message"""
-    help_text = """
-**🌿 Garden Advisor Bot - Commands**
-
-**How to use:**
+# Built once; embeds also allow a longer (4096-character) description
+_HELP_TEXT = """**How to use:**
 - Mention me (@Garden Advisor) or DM me with your questions
+- End a question with `!nocache` to get a fresh (uncached) answer
 - I can help with plant care, watering reminders, weather checks, and more!
 
-**Commands:**
+**Commands:** (as `/` slash commands or with the `!` prefix)
 - `!helpme` - Show this help message
 - `!myplants` - List your plants
 - `!reminders` - Show your watering reminders
@@ -107,14 +291,34 @@ async def help_command(ctx):
 - Watering reminders
 - Plant knowledge base
 """
-    await ctx.send(help_text)
+_HELP_EMBED = discord.Embed(
+    title="🌿 Garden Advisor Bot - Commands",
+    description=_HELP_TEXT,
+    color=discord.Color.green()
+)
 
 
-@bot.command(name='myplants')
+@bot.hybrid_command(name='helpme')
+async def help_command(ctx):
+    """Show help message"""
+    await ctx.send(embed=_HELP_EMBED)
+
+
+@bot.hybrid_command(name='myplants')
 async def my_plants_command(ctx):
     """Show user's plants"""
+    if _starting_up():
+        await ctx.send(STARTUP_MESSAGE)
+        return
+    # A cold ChromaDB lookup can outlast the 3s slash-command response window
+    await ctx.defer()
     user_id = str(ctx.author.id)
-    plants = agent.get_user_plants(user_id)
+    plants = _plants_cache.get(user_id)
+    if plants is None:
+        agent = await _get_agent()
+        # ChromaDB lookups are blocking, keep them off the event loop
+        plants = await asyncio.to_thread(agent.get_user_plants, user_id)
+        _plants_cache[user_id] = plants
     
     if plants:
         plants_list = '\n'.join([f"{plant}" for plant in plants])
@@ -123,10 +327,14 @@ async def my_plants_command(ctx):
         await ctx.send("You haven't mentioned any plants yet. Tell me about your garden!")
 
 
-@bot.command(name='reminders')
+@bot.hybrid_command(name='reminders')
 async def reminders_command(ctx):
     """Show user's reminders"""
+    if _starting_up():
+        await ctx.send(STARTUP_MESSAGE)
+        return
     user_id = str(ctx.author.id)
+    agent = await _get_agent()
     reminders = agent.tool_manager.get_user_reminders(user_id)
     
     if reminders:
@@ -144,26 +352,37 @@ async def reminders_command(ctx):
         await ctx.send("You haven't set any reminders yet. Try: 'Water tomato every 2 days'")
 
 
-@bot.command(name='clear')
+@bot.hybrid_command(name='clear')
 async def clear_command(ctx):
     """Clear user's conversation history and reminders"""
+    if _starting_up():
+        await ctx.send(STARTUP_MESSAGE)
+        return
+    await ctx.defer()
     user_id = str(ctx.author.id)
+    agent = await _get_agent()
 
     # Hapus riwayat percakapan
-    agent.memory_manager.clear_user_memory(user_id)
+    await asyncio.to_thread(agent.memory_manager.clear_user_memory, user_id)
+    response_cache.clear_user(user_id)
+    _plants_cache.pop(user_id, None)
 
     # Hapus semua schedule user
     if hasattr(agent, "tool_manager") and hasattr(agent.tool_manager, "clear_user_reminders"):
-        agent.tool_manager.clear_user_reminders(user_id)
+        await asyncio.to_thread(agent.tool_manager.clear_user_reminders, user_id)
 
     await ctx.send("✅ Your conversation history and reminders have been cleared.")
 
 
-@bot.command(name='weather')
+@bot.hybrid_command(name='weather')
 async def weather_command(ctx, *, location: str):
     """Check weather for a location"""
+    if _starting_up():
+        await ctx.send(STARTUP_MESSAGE)
+        return
     async with ctx.typing():
-        result = agent.tool_manager.get_weather(location)
+        agent = await _get_agent()
+        result = await agent.tool_manager.aget_weather(location)
         await ctx.send(result)
 
 
@@ -0,0 +1,53 @@
+"""
+Shared test fixtures
+"""
+import re
+import zlib
+import pytest
+import numpy as np
+from unittest.mock import MagicMock
+
+from core.agent import GardenAdvisorAgent
+from core.embeddings import SharedEmbeddingFunction
+from core.memory import MemoryManager
+from core.tools import ToolManager
+
+class StubEmbeddingFunction(SharedEmbeddingFunction):
+    """Offline stand-in for the MiniLM model: hashed bag-of-words vectors"""
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            vec = np.zeros(384, dtype=np.float32)
+            for word in re.findall(r"[a-z]+", text.lower()):
+                vec[zlib.crc32(word.encode()) % len(vec)] += 1.0
+            norm = np.linalg.norm(vec)
+            if norm:
+                vec /= norm
+            else:
+                vec[0] = 1.0
+            vectors.append(vec)
+        return vectors
+
+@pytest.fixture
+def stub_memory_manager(tmp_path, monkeypatch):
+    """MemoryManager on a temporary ChromaDB path, embedding with StubEmbeddingFunction"""
+    monkeypatch.setenv('CHROMA_DB_PATH', str(tmp_path / 'chroma'))
+    # The model and plant embeddings are shared per process: swap them for this test only
+    monkeypatch.setattr(MemoryManager, '_embed_fn', StubEmbeddingFunction())
+    monkeypatch.setattr(MemoryManager, '_plant_index', None)
+    return MemoryManager()
+
+@pytest.fixture
+def offline_agent(tmp_path, monkeypatch):
+    """Agent with a mocked LLM client and memory, keeping its cache and reminders in tmp_path"""
+    monkeypatch.setenv('LLM_CACHE_PATH', str(tmp_path / 'llm_cache.sqlite3'))
+    monkeypatch.setenv('REMINDER_FILE', str(tmp_path / 'reminders.jsonl'))
+    monkeypatch.setattr('core.agent.AsyncOpenAI', MagicMock())
+    monkeypatch.setattr('core.agent.MemoryManager', MagicMock())
+    # A private ToolManager instead of the process-wide one, so REMINDER_FILE applies
+    monkeypatch.setattr('core.agent.get_tool_manager', ToolManager)
+
+    agent = GardenAdvisorAgent()
+    yield agent
+    agent.cleanup()
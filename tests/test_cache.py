@@ -0,0 +1,101 @@
+"""
+Unit tests for the LLM and semantic response caches
+"""
+import pytest
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from core.agent import _LLM_ERROR_MESSAGE
+from core.cache import LLMCache, SemanticCache
+
+@pytest.fixture
+def llm_cache(tmp_path):
+    """Create LLMCache backed by a temporary database"""
+    cache = LLMCache(path=str(tmp_path / 'llm.sqlite3'), ttl=60)
+    yield cache
+    cache.close()
+
+def test_llm_cache_key_is_stable(llm_cache):
+    """Test keys ignore dict key order but change with the model or any message"""
+    messages = [{"role": "system", "content": "Be brief"}, {"role": "user", "content": "Tomatoes?"}]
+    reordered = [{"content": m["content"], "role": m["role"]} for m in messages]
+
+    key = LLMCache.make_key("model-a", messages)
+    assert LLMCache.make_key("model-a", reordered) == key
+    assert LLMCache.make_key("model-b", messages) != key
+    assert LLMCache.make_key("model-a", messages[1:]) != key
+
+def test_llm_cache_round_trip_and_expiry(llm_cache, tmp_path):
+    """Test stored responses come back until their TTL runs out"""
+    llm_cache.set("key", "Water weekly")
+    assert llm_cache.get("key") == "Water weekly"
+    assert llm_cache.get("missing") is None
+
+    expired = LLMCache(path=str(tmp_path / 'expired.sqlite3'), ttl=-1)
+    expired.set("key", "Water weekly")
+    assert expired.get("key") is None
+    expired.close()
+
+def _completion(content):
+    return MagicMock(choices=[MagicMock(message=MagicMock(content=content))], usage=None)
+
+@pytest.mark.parametrize("create", [
+    AsyncMock(side_effect=RuntimeError("LLM unavailable")),
+    AsyncMock(return_value=_completion("")),
+], ids=["error", "empty"])
+def test_llm_failures_are_not_cached(offline_agent, create):
+    """Test error and empty LLM responses are never stored"""
+    offline_agent.client.chat.completions.create = create
+    messages = [SystemMessage(content="Be brief"), HumanMessage(content="Roses?")]
+    key = offline_agent.llm_cache.make_key(
+        offline_agent.model, offline_agent._format_messages(messages)
+    )
+
+    response = asyncio.run(offline_agent.llm(messages))
+
+    assert response.content in (_LLM_ERROR_MESSAGE, "")
+    assert offline_agent.llm_cache.get(key) is None
+
+@pytest.fixture
+def semantic_cache(tmp_path):
+    """Create SemanticCache backed by a temporary database"""
+    cache = SemanticCache(path=str(tmp_path / 'semantic.sqlite3'), ttl=60,
+                          threshold=0.85, max_entries=2)
+    yield cache
+    cache.close()
+
+def test_semantic_cache_hit_and_miss(semantic_cache):
+    """Test near-duplicate queries hit and unrelated ones miss"""
+    semantic_cache.set("user1", [1.0, 0.0, 0.0], "Water tomatoes daily")
+
+    assert semantic_cache.get("user1", [0.95, 0.1, 0.0]) == "Water tomatoes daily"
+    assert semantic_cache.get("user1", [0.0, 1.0, 0.0]) is None
+
+def test_semantic_cache_user_isolation(semantic_cache):
+    """Test entries are scoped per user and cleared per user"""
+    semantic_cache.set("user1", [1.0, 0.0, 0.0], "Answer for user1")
+
+    assert semantic_cache.get("user2", [1.0, 0.0, 0.0]) is None
+
+    semantic_cache.clear_user("user1")
+    assert semantic_cache.get("user1", [1.0, 0.0, 0.0]) is None
+
+def test_semantic_cache_lru_eviction(semantic_cache):
+    """Test the least recently used entry is evicted past max_entries"""
+    semantic_cache.set("user1", [1.0, 0.0, 0.0], "first")
+    semantic_cache.set("user1", [0.0, 1.0, 0.0], "second")
+    semantic_cache.get("user1", [1.0, 0.0, 0.0])
+    semantic_cache.set("user1", [0.0, 0.0, 1.0], "third")
+
+    assert semantic_cache.get("user1", [1.0, 0.0, 0.0]) == "first"
+    assert semantic_cache.get("user1", [0.0, 1.0, 0.0]) is None
+
+def test_semantic_cache_expiry(tmp_path):
+    """Test expired entries are not returned"""
+    cache = SemanticCache(path=str(tmp_path / 'semantic.sqlite3'), ttl=-1)
+    cache.set("user1", [1.0, 0.0, 0.0], "stale")
+
+    assert cache.get("user1", [1.0, 0.0, 0.0]) is None
+    cache.close()
@@ -0,0 +1,146 @@
+"""
+Unit tests for the Discord bot helpers
+"""
+import pytest
+import sys
+import time
+import asyncio
+
+pytest.importorskip("discord")
+
+from integration import discord_bot
+from integration.discord_bot import _split_message, _rate_limited_send
+
+def test_short_message_not_split():
+    """Test a message under the limit is sent as one chunk"""
+    assert list(_split_message("Water your tomatoes daily.")) == ["Water your tomatoes daily."]
+
+def test_split_prefers_paragraphs():
+    """Test long messages split at paragraph boundaries first"""
+    first = "Tomatoes need full sun. " * 40
+    second = "Basil likes moist soil. " * 40
+    chunks = list(_split_message(first + "\n\n" + second, limit=1500))
+
+    assert chunks == [first.strip(), second.strip()]
+
+def test_split_never_breaks_words():
+    """Test chunks respect the limit and only split between words"""
+    text = " ".join(["watering"] * 600)
+    chunks = list(_split_message(text))
+
+    assert all(len(chunk) <= 2000 for chunk in chunks)
+    assert all(word == "watering" for chunk in chunks for word in chunk.split(" "))
+    assert " ".join(chunks) == text
+
+def test_split_hard_cut_without_boundaries():
+    """Test text without any boundary is still cut to the limit"""
+    chunks = list(_split_message("🌱" * 4500))
+
+    assert [len(chunk) for chunk in chunks] == [2000, 2000, 500]
+
+def test_rate_limited_send_waits_for_window(monkeypatch):
+    """Test sends past the per-channel limit wait for the window to slide"""
+    monkeypatch.setattr(discord_bot, "CHANNEL_SEND_LIMIT", 2)
+    monkeypatch.setattr(discord_bot, "CHANNEL_SEND_WINDOW", 0.3)
+
+    class FakeChannel:
+        id = "rate-limit-test"
+
+        def __init__(self):
+            self.sent = []
+
+        async def send(self, content):
+            self.sent.append((content, time.monotonic()))
+
+    async def send_all(channel):
+        for content in ("one", "two", "three"):
+            await _rate_limited_send(channel, content)
+
+    channel = FakeChannel()
+    asyncio.run(send_all(channel))
+
+    assert [content for content, _ in channel.sent] == ["one", "two", "three"]
+    assert channel.sent[2][1] - channel.sent[0][1] >= 0.29
+
+def test_single_bot_module_loaded():
+    """Test only one discord_bot module is imported (no stale duplicate on sys.path)"""
+    bot_modules = [m for m in sys.modules if m.rsplit('.', 1)[-1] == 'discord_bot']
+    assert bot_modules == ['integration.discord_bot']
+
+def test_stream_response_edits_and_rolls_over(monkeypatch):
+    """Test streamed replies grow in place and continue in a new message when full"""
+    monkeypatch.setattr(discord_bot, "EMBED_DESCRIPTION_LIMIT", 50)
+    monkeypatch.setattr(discord_bot, "STREAM_EDIT_INTERVAL", 0)
+
+    class FakeMessage:
+        def __init__(self, embed):
+            self.description = embed.description
+
+        async def edit(self, embed):
+            self.description = embed.description
+
+    class FakeChannel:
+        id = "stream-test"
+
+        def __init__(self):
+            self.messages = []
+
+        async def send(self, content=None, embed=None):
+            self.messages.append(FakeMessage(embed))
+            return self.messages[-1]
+
+    async def deltas():
+        for word in ["Water "] * 15:
+            yield word
+
+    channel = FakeChannel()
+    response = asyncio.run(discord_bot._stream_response(channel, deltas()))
+
+    assert response == ("Water " * 15).strip()
+    assert all(len(m.description) <= 50 for m in channel.messages)
+    assert " ".join(m.description for m in channel.messages) == response
+
+def test_stream_response_flushes_and_raises_when_interrupted():
+    """Test an interrupted stream shows the partial text and re-raises (so it is never cached)"""
+    class FakeMessage:
+        def __init__(self, embed):
+            self.description = embed.description
+
+        async def edit(self, embed):
+            self.description = embed.description
+
+    class FakeChannel:
+        id = "stream-interrupted-test"
+
+        def __init__(self):
+            self.messages = []
+
+        async def send(self, content=None, embed=None):
+            self.messages.append(FakeMessage(embed))
+            return self.messages[-1]
+
+    async def deltas():
+        yield "Water the roses "
+        raise ConnectionError("reset")
+
+    channel = FakeChannel()
+    with pytest.raises(ConnectionError):
+        asyncio.run(discord_bot._stream_response(channel, deltas()))
+
+    assert [m.description for m in channel.messages] == ["Water the roses"]
+
+def test_starting_up_until_warm_up_finishes(monkeypatch):
+    """Test handlers fast-fail while the agent is still being built"""
+    monkeypatch.setattr(discord_bot, "agent", None)
+    monkeypatch.setattr(discord_bot, "_mention_re", None)
+    assert discord_bot._starting_up()
+
+    async def check():
+        monkeypatch.setattr(discord_bot, "_mention_re", discord_bot.re.compile(r'<@!?1>'))
+        warm_up = asyncio.ensure_future(asyncio.sleep(0.05))
+        monkeypatch.setattr(discord_bot, "_warmup_task", warm_up)
+        assert discord_bot._starting_up()
+        await warm_up
+        assert not discord_bot._starting_up()
+
+    asyncio.run(check())
@@ -0,0 +1,108 @@
+"""
+Unit tests for the LLM request dispatcher
+"""
+import pytest
+import time
+import asyncio
+
+from core.dispatcher import BatchDispatcher
+
+def _recording_send(calls, error=None):
+    """Fake send: records each request's kwargs and the time it went out"""
+    async def send(**kwargs):
+        calls.append((kwargs, time.monotonic()))
+        if error is not None:
+            raise error
+        return kwargs["n"] * 2
+    return send
+
+def test_flushes_when_batch_is_full():
+    """Test a full batch goes out without waiting for the window"""
+    calls = []
+    dispatcher = BatchDispatcher(_recording_send(calls), max_batch=2, max_delay=5)
+
+    async def run():
+        return await asyncio.gather(dispatcher.submit(n=1), dispatcher.submit(n=2))
+
+    start = time.monotonic()
+    assert asyncio.run(run()) == [2, 4]
+    assert time.monotonic() - start < 1
+    assert len(calls) == 2
+
+def test_flushes_at_window_deadline():
+    """Test a partial batch goes out once max_delay has passed"""
+    calls = []
+    dispatcher = BatchDispatcher(_recording_send(calls), max_batch=10, max_delay=0.05)
+
+    async def run():
+        start = time.monotonic()
+        results = await asyncio.gather(dispatcher.submit(n=1), dispatcher.submit(n=2))
+        return results, start
+
+    results, start = asyncio.run(run())
+    assert results == [2, 4]
+    assert all(sent_at - start >= 0.045 for _, sent_at in calls)
+
+def test_error_reaches_every_waiting_request():
+    """Test a failing send raises in every caller of the batch"""
+    calls = []
+    dispatcher = BatchDispatcher(
+        _recording_send(calls, error=RuntimeError("LLM unavailable")), max_delay=0.01
+    )
+
+    async def run():
+        return await asyncio.gather(
+            *(dispatcher.submit(n=n) for n in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert len(results) == 3
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+def test_restarts_on_a_new_event_loop():
+    """Test the dispatcher keeps working when used from a second event loop"""
+    calls = []
+    dispatcher = BatchDispatcher(_recording_send(calls), max_delay=0.01)
+
+    assert asyncio.run(dispatcher.submit(n=1)) == 2
+    assert asyncio.run(dispatcher.submit(n=2)) == 4
+
+def test_lone_request_sent_immediately():
+    """Test a request on an idle dispatcher doesn't wait for the window"""
+    calls = []
+    dispatcher = BatchDispatcher(_recording_send(calls), max_batch=10, max_delay=5)
+
+    start = time.monotonic()
+    assert asyncio.run(dispatcher.submit(n=1)) == 2
+    assert time.monotonic() - start < 1
+
+def test_close_cancels_pending_requests():
+    """Test requests still waiting for their batch are cancelled on close"""
+    calls = []
+    release = None
+    record = _recording_send(calls)
+
+    async def slow_send(**kwargs):
+        await release.wait()
+        return await record(**kwargs)
+
+    dispatcher = BatchDispatcher(slow_send, max_batch=10, max_delay=5)
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        sent = asyncio.ensure_future(dispatcher.submit(n=1))  # idle: goes out at once
+        await asyncio.sleep(0.01)
+        pending = asyncio.ensure_future(dispatcher.submit(n=2))  # busy: batch window opens
+        await asyncio.sleep(0.01)
+        dispatcher.close()
+        with pytest.raises(asyncio.CancelledError):
+            await pending
+
+        # The request already sent still completes, and a new one starts a fresh worker
+        release.set()
+        dispatcher.max_delay = 0.01
+        return await sent, await dispatcher.submit(n=3)
+
+    assert asyncio.run(run()) == (2, 6)
+    assert [kwargs for kwargs, _ in calls] == [{"n": 1}, {"n": 3}]
@@ -2,23 +2,17 @@
 Unit tests for Memory Management
 """
 import pytest
-import os
-import sys
-import tempfile
-import shutil
-
-# Add parent directory to path
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from types import SimpleNamespace
 
+import core.memory as memory_module
+from core.embeddings import SharedEmbeddingFunction
 from core.memory import MemoryManager
 
 @pytest.fixture
-def temp_chroma_path():
+def temp_chroma_path(tmp_path, monkeypatch):
     """Create temporary ChromaDB path"""
-    temp_dir = tempfile.mkdtemp()
-    os.environ['CHROMA_DB_PATH'] = temp_dir
-    yield temp_dir
-    shutil.rmtree(temp_dir, ignore_errors=True)
+    monkeypatch.setenv('CHROMA_DB_PATH', str(tmp_path))
+    return str(tmp_path)
 
 @pytest.fixture
 def memory_manager(temp_chroma_path):
@@ -60,6 +54,7 @@ def test_short_term_memory_limit(memory_manager):
     # Should only keep last 20 messages (10 pairs)
     assert len(history) <= 20
 
+@pytest.mark.integration
 def test_long_term_memory_storage(memory_manager):
     """Test long-term memory storage in ChromaDB"""
     user_id = "test_user_789"
@@ -93,6 +88,7 @@ def test_per_user_memory_isolation(memory_manager):
     assert "roses" not in str(history1).lower()
     assert "tomatoes" not in str(history2).lower()
 
+@pytest.mark.integration
 def test_plant_knowledge_retrieval(memory_manager):
     """Test RAG retrieval from plant knowledge base"""
     knowledge = memory_manager.get_plant_knowledge("tomato care")
@@ -100,6 +96,25 @@ def test_plant_knowledge_retrieval(memory_manager):
     assert len(knowledge) > 0
     assert any(word in knowledge.lower() for word in ['tomato', 'water', 'sunlight'])
 
+@pytest.mark.integration
+def test_embedding_model_shared(memory_manager, tmp_path_factory, monkeypatch):
+    """Test managers reuse one embedding model and embed the plant documents once"""
+    calls = []
+    embed = SharedEmbeddingFunction.__call__
+
+    def counting_embed(self, input):
+        calls.append(input)
+        return embed(self, input)
+
+    monkeypatch.setattr(SharedEmbeddingFunction, "__call__", counting_embed)
+    # A fresh ChromaDB directory, so the plant knowledge is seeded again
+    monkeypatch.setenv('CHROMA_DB_PATH', str(tmp_path_factory.mktemp("chroma")))
+    other = MemoryManager()
+    
+    assert other.embed_fn is memory_manager.embed_fn
+    assert other.plant_collection.count() > 0
+    assert calls == []
+
 def test_clear_user_memory(memory_manager):
     """Test clearing user memory"""
     user_id = "test_clear_user"
@@ -114,6 +129,7 @@ def test_clear_user_memory(memory_manager):
     history = memory_manager.get_short_term_memory(user_id)
     assert len(history) == 0
 
+@pytest.mark.integration
 def test_get_user_plants(memory_manager):
     """Test extracting plants mentioned by user"""
     user_id = "test_plants_user"
@@ -131,5 +147,89 @@ def test_get_user_plants(memory_manager):
     assert any('tomato' in plant.lower() for plant in plants) or \
            any('basil' in plant.lower() for plant in plants)
 
+def _stored_ids(memory_manager, user_id):
+    return sorted(memory_manager.memory_collection.get(where={"user_id": user_id})['ids'])
+
+def _fake_clock(monkeypatch, start=1_000_000.0):
+    """Replace core.memory's clock; returns a function advancing it by some hours"""
+    now = [start]
+    monkeypatch.setattr(memory_module, "time", SimpleNamespace(time=lambda: now[0]))
+
+    def advance(hours):
+        now[0] += hours * 3600
+    return advance
+
+def test_eviction_drops_oldest_past_limit(stub_memory_manager, monkeypatch):
+    """Test the oldest entry is evicted once a user exceeds the per-user cap"""
+    advance = _fake_clock(monkeypatch)
+    stub_memory_manager.max_long_term_per_user = 2
+    
+    for question in ["Is it sunny today?", "What music helps focus?", "Any good books?"]:
+        stub_memory_manager.add_to_long_term_memory("user_evict", question, "Sure thing.")
+        advance(hours=24)
+    
+    assert _stored_ids(stub_memory_manager, "user_evict") == ["user_evict_1", "user_evict_2"]
+
+def test_eviction_keeps_plant_exchanges_longer(stub_memory_manager, monkeypatch):
+    """Test importance outweighs a small age difference when choosing what to evict"""
+    advance = _fake_clock(monkeypatch)
+    stub_memory_manager.max_long_term_per_user = 2
+    
+    stub_memory_manager.add_to_long_term_memory("user_evict", "How do I prune roses?", "Cut above a bud.")
+    advance(hours=2)
+    stub_memory_manager.add_to_long_term_memory("user_evict", "Is it sunny today?", "Yes.")
+    advance(hours=2)
+    stub_memory_manager.add_to_long_term_memory("user_evict", "Any good books?", "Plenty.")
+    
+    assert _stored_ids(stub_memory_manager, "user_evict") == ["user_evict_0", "user_evict_2"]
+
+def test_doc_ids_continue_after_restart(stub_memory_manager):
+    """Test a new manager continues after the highest stored id, even with gaps"""
+    stub_memory_manager.add_many("user_ids", [
+        ("Is it sunny today?", "Yes."),
+        ("What music helps focus?", "Lo-fi."),
+        ("Any good books?", "Plenty."),
+    ])
+    stub_memory_manager.memory_collection.delete(ids=["user_ids_0"])
+    
+    restarted = MemoryManager()
+    restarted.add_to_long_term_memory("user_ids", "Should I buy a plant?", "Yes, a fern.")
+    
+    assert _stored_ids(restarted, "user_ids") == ["user_ids_1", "user_ids_2", "user_ids_3"]
+
+def test_near_duplicate_memory_skipped(stub_memory_manager):
+    """Test a repeated exchange is not stored twice while a distinct one is"""
+    stub_memory_manager.add_to_long_term_memory("user_dup", "How do I water tomatoes?", "Every 2-3 days.")
+    stub_memory_manager.add_to_long_term_memory("user_dup", "How do I water tomatoes?", "Every 2-3 days.")
+    stub_memory_manager.add_to_long_term_memory("user_dup", "Which soil suits cactus?", "A sandy mix.")
+    
+    stored = stub_memory_manager.memory_collection.get(where={"user_id": "user_dup"})
+    assert len(stored['ids']) == 2
+    assert any("cactus" in doc for doc in stored['documents'])
+
+def test_add_many_single_insert(stub_memory_manager, monkeypatch):
+    """Test several exchanges land in one collection.add with unique ids and metadata"""
+    calls = []
+    add = stub_memory_manager.memory_collection.add
+
+    def spy(**kwargs):
+        calls.append(kwargs)
+        return add(**kwargs)
+
+    monkeypatch.setattr(stub_memory_manager.memory_collection, "add", spy)
+    
+    stub_memory_manager.add_many("user_bulk", [
+        ("How do I grow basil?", "Pinch the flowers."),
+        ("Is it sunny today?", "Yes."),
+        ("When do roses bloom?", "Late spring."),
+    ])
+    
+    assert len(calls) == 1
+    assert calls[0]['ids'] == ["user_bulk_0", "user_bulk_1", "user_bulk_2"]
+    metadatas = calls[0]['metadatas']
+    assert all(m['user_id'] == "user_bulk" for m in metadatas)
+    assert [m['importance'] for m in metadatas] == [1.0, 0.5, 1.0]
+    assert _stored_ids(stub_memory_manager, "user_bulk") == calls[0]['ids']
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
\ No newline at end of file
@@ -2,12 +2,11 @@
 Unit tests for Planner
 """
 import pytest
-import os
-import sys
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import MagicMock
 
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
-from core.planner import Planner
+from core.planner import Planner, _extract_json
 
 @pytest.fixture
 def planner():
@@ -90,5 +89,75 @@ def test_multiple_keywords_query(planner):
     # Should prioritize weather check
     assert plan['type'] in ['weather_check', 'plant_care']
 
+def test_requires_tools(planner):
+    """Test tool detection used to decide which answers can be cached"""
+    assert planner.requires_tools("Should I water my plants today in New York?")
+    assert not planner.requires_tools("How do I care for tomatoes?")
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"steps": ["use {braces}", "} or {"]}', '{"steps": ["use {braces}", "} or {"]}'),
+    ('{"note": "say \\"}\\" twice"}', '{"note": "say \\"}\\" twice"}'),
+    ('{"a": {"b": {"c": 1}}, "d": 2}', '{"a": {"b": {"c": 1}}, "d": 2}'),
+    ('Here\'s the plan: {"type": "x"} Hope it\'s {useful}', '{"type": "x"}'),
+    ("No JSON here, it's just prose.", None),
+    ('{"unterminated": [1, 2', None),
+])
+def test_extract_json(text, expected):
+    """Test the first balanced object is found despite braces and quotes in strings"""
+    assert _extract_json(text) == expected
+
+class FakeBatchLLM:
+    """LLM stand-in whose abatch returns a fixed mix of responses and exceptions"""
+
+    def __init__(self, results):
+        self.results = results
+        self.prompts = None
+
+    async def abatch(self, prompts, config=None, return_exceptions=False):
+        self.prompts = prompts
+        return self.results
+
+def test_batched_plans_fall_back_per_item(planner):
+    """Test only the queries whose batched LLM call failed get the fallback plan"""
+    planner.llm = FakeBatchLLM([
+        SimpleNamespace(content='{"type": "trivia", "steps": ["Answer"], "requires_tools": false}'),
+        RuntimeError("rate limited"),
+        SimpleNamespace(content='{"type": "history", "steps": ["Recall"], "requires_tools": false}'),
+    ])
+    queries = [
+        "What is the capital of France?",
+        "Tell me a story about dragons",
+        "Who painted the Mona Lisa?",
+        "Should I water my plants today?",
+    ]
+    
+    plans = asyncio.run(planner.acreate_plans(queries))
+    
+    assert len(planner.llm.prompts) == 3  # the weather query is answered by rules
+    assert [plan['type'] for plan in plans] == ['trivia', 'fallback_general', 'history', 'weather_check']
+    assert [plan['query'] for plan in plans] == queries
+
+def test_rule_plan_steps_shared(planner):
+    """Test rule plans share the table's step tuple and adjusting one leaves it intact"""
+    query = "Remind me to water roses every 3 days"
+    plan = planner.create_plan(query)
+    assert plan['steps'] is planner.create_plan(query)['steps']
+    
+    planner.adjust_plan(plan, "tool failed")
+    assert 'Retry with alternative approach' in plan['steps']
+    assert 'Retry with alternative approach' not in planner.create_plan(query)['steps']
+
+@pytest.mark.parametrize("query", ["hi", "123 ?", "!!! ??? ..."])
+def test_trivial_query_skips_llm(planner, query):
+    """Test greetings and letter-free queries get the generic plan without an LLM call"""
+    planner.llm = MagicMock()
+    
+    plan = planner.create_plan(query)
+    
+    assert plan['type'] == 'trivial'
+    assert plan['query'] == query
+    assert plan['steps'] is Planner._TRIVIAL_PLAN['steps']
+    assert not planner.llm.mock_calls
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
\ No newline at end of file
@@ -4,13 +4,6 @@ Tests the ChromaDB-based knowledge retrieval system using MemoryManager
 """
 
 import pytest
-import os
-import sys
-import tempfile
-import shutil
-
-# Ensure project root path is available for imports
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from core.memory import MemoryManager
 
@@ -20,12 +13,12 @@ from core.memory import MemoryManager
 # ==========================================================
 
 @pytest.fixture(scope="module")
-def temp_chroma_path():
+def temp_chroma_path(tmp_path_factory):
     """Create temporary ChromaDB path for isolated testing"""
-    temp_dir = tempfile.mkdtemp()
-    os.environ["CHROMA_DB_PATH"] = temp_dir
-    yield temp_dir
-    shutil.rmtree(temp_dir, ignore_errors=True)
+    temp_dir = str(tmp_path_factory.mktemp("chroma"))
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("CHROMA_DB_PATH", temp_dir)
+        yield temp_dir
 
 
 @pytest.fixture(scope="module")
@@ -38,6 +31,7 @@ def memory_manager(temp_chroma_path):
 # === Tests for Plant Knowledge (RAG Base) =================
 # ==========================================================
 
+@pytest.mark.integration
 def test_plant_knowledge_base_exists(memory_manager):
     """Ensure plant knowledge base collection exists and has data"""
     collection = memory_manager.plant_collection
@@ -47,6 +41,7 @@ def test_plant_knowledge_base_exists(memory_manager):
     assert len(results["ids"]) > 0, "Plant knowledge base should contain data"
 
 
+@pytest.mark.integration
 def test_retrieve_plant_knowledge(memory_manager):
     """Retrieve plant care information for a known plant"""
     knowledge = memory_manager.get_plant_knowledge("tomato")
@@ -55,6 +50,7 @@ def test_retrieve_plant_knowledge(memory_manager):
     assert any(word in knowledge.lower() for word in ["tomato", "water", "soil", "sunlight"])
 
 
+@pytest.mark.integration
 def test_rag_relevance(memory_manager):
     """Check that different plant queries yield distinct results"""
     tomato_knowledge = memory_manager.get_plant_knowledge("tomato watering")
@@ -67,6 +63,7 @@ def test_rag_relevance(memory_manager):
     assert tomato_knowledge != cactus_knowledge, "Different plants should yield different info"
 
 
+@pytest.mark.integration
 def test_rag_multiple_results(memory_manager):
     """Test retrieval of multiple relevant knowledge entries"""
     knowledge = memory_manager.get_plant_knowledge("watering schedule", n_results=3)
@@ -74,6 +71,7 @@ def test_rag_multiple_results(memory_manager):
     assert len(knowledge) > 0
 
 
+@pytest.mark.integration
 def test_rag_empty_query(memory_manager):
     """Ensure RAG handles empty query safely"""
     result = memory_manager.get_plant_knowledge("")
@@ -84,6 +82,7 @@ def test_rag_empty_query(memory_manager):
 # === Tests for Long-Term User Memory + RAG =================
 # ==========================================================
 
+@pytest.mark.integration
 def test_user_memory_rag(memory_manager):
     """Test retrieving relevant long-term memory for a user"""
     user_id = "test_rag_user"
@@ -121,6 +120,7 @@ def test_per_user_rag_isolation(memory_manager):
         assert ("rose" in relevant2.lower() or "tomato" not in relevant2.lower())
 
 
+@pytest.mark.integration
 def test_rag_with_metadata(memory_manager):
     """Verify metadata is stored correctly for user memories"""
     user_id = "metadata_test_user"
@@ -138,29 +138,75 @@ def test_rag_with_metadata(memory_manager):
 # === General RAG Behavior =================================
 # ==========================================================
 
+@pytest.mark.integration
 def test_rag_query_similarity(memory_manager):
     """Similar queries should yield similar information"""
     query1 = "how to water tomatoes"
     query2 = "tomato watering guide"
 
-    result1 = memory_manager.get_plant_knowledge(query1)
-    result2 = memory_manager.get_plant_knowledge(query2)
+    result1, result2 = memory_manager.get_plant_knowledge_batch([query1, query2])
 
     assert isinstance(result1, str)
     assert isinstance(result2, str)
     assert len(result1) > 0 and len(result2) > 0
 
 
+@pytest.mark.integration
 def test_plant_knowledge_comprehensiveness(memory_manager):
     """Ensure plant knowledge covers core care aspects"""
     knowledge = memory_manager.get_plant_knowledge("complete plant care guide")
 
     care_aspects = ["water", "sunlight", "soil"]
-    found_aspects = sum(1 for aspect in care_aspects if aspect in knowledge.lower())
+    knowledge_lower = knowledge.lower()
+    found_aspects = sum(1 for aspect in care_aspects if aspect in knowledge_lower)
 
     assert found_aspects >= 1, "Knowledge should cover basic care aspects"
 
 
+def _spy_on_plant_queries(memory_manager, monkeypatch):
+    """Record every query sent to the plant knowledge collection"""
+    calls = []
+    query = memory_manager.plant_collection.query
+
+    def spy(**kwargs):
+        calls.append(kwargs)
+        return query(**kwargs)
+
+    monkeypatch.setattr(memory_manager.plant_collection, "query", spy)
+    monkeypatch.setattr(memory_manager, "_plant_cache", {})
+    return calls
+
+
+@pytest.mark.integration
+def test_plant_knowledge_cached_for_near_duplicate_query(memory_manager, monkeypatch):
+    """A near-identical query is answered without another collection query"""
+    calls = _spy_on_plant_queries(memory_manager, monkeypatch)
+
+    first = memory_manager.get_plant_knowledge("How do I water my orchid?")
+    second = memory_manager.get_plant_knowledge("how do I water my orchid")
+
+    assert second == first
+    assert len(calls) == 1
+
+    # Results are kept per n_results, and different queries still reach the collection
+    memory_manager.get_plant_knowledge("How do I water my orchid?", n_results=3)
+    memory_manager.get_plant_knowledge("sandy soil for cactus")
+    assert len(calls) == 3
+
+
+@pytest.mark.integration
+def test_plant_knowledge_cache_is_bounded(memory_manager, monkeypatch):
+    """Past plant_cache_size entries the oldest result is dropped"""
+    calls = _spy_on_plant_queries(memory_manager, monkeypatch)
+    monkeypatch.setattr(memory_manager, "plant_cache_size", 1)
+
+    memory_manager.get_plant_knowledge("How do I water my orchid?")
+    memory_manager.get_plant_knowledge("sandy soil for cactus")
+    memory_manager.get_plant_knowledge("How do I water my orchid?")
+
+    assert len(calls) == 3
+
+
 # ==========================================================
 # === Entry Point ==========================================
 # ==========================================================
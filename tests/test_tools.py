@@ -2,29 +2,38 @@
 Unit tests for Tool Manager
 """
 import pytest
-import os
-import sys
 import json
-import tempfile
-
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import threading
+import weakref
+import gc
+import asyncio
+from unittest.mock import MagicMock
+from cachetools import TTLCache
 
 from core.tools import ToolManager
 
-@pytest.fixture
-def temp_reminder_file():
-    """Create temporary reminder file"""
-    temp_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json')
-    temp_file.write('{}')
-    temp_file.close()
-    os.environ['REMINDER_FILE'] = temp_file.name
-    yield temp_file.name
-    os.unlink(temp_file.name)
+@pytest.fixture(scope="module")
+def temp_reminder_file(tmp_path_factory):
+    """Create temporary reminder file (once per module)"""
+    path = tmp_path_factory.mktemp("reminders") / "reminders.jsonl"
+    path.write_text('')
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('REMINDER_FILE', str(path))
+        yield str(path)
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def tool_manager(temp_reminder_file):
-    """Create ToolManager instance"""
-    return ToolManager()
+    """Create ToolManager instance (shared by the module's tests)"""
+    manager = ToolManager()
+    yield manager
+    manager.flush()
+
+@pytest.fixture(autouse=True)
+def reset_reminders(tool_manager):
+    """Clear reminders between tests instead of rebuilding the manager"""
+    yield
+    for user_id in tool_manager.get_all_users():
+        tool_manager.clear_user_reminders(user_id)
 
 def test_calculator_tool(tool_manager):
     """Test calculator tool"""
@@ -38,12 +47,24 @@ def test_calculator_safety(tool_manager):
     
     assert "Invalid" in result or "error" in result.lower()
 
+@pytest.mark.parametrize("expression", ["9**9**9", "(((9**99)**99)**99)**99", "2**(2**20)"])
+def test_calculator_rejects_huge_powers(tool_manager, expression):
+    """Test powers whose result would be enormous are refused instead of computed"""
+    result = tool_manager.calculate(expression)
+    assert "too large" in result
+
+def test_calculator_power(tool_manager):
+    """Test ordinary powers still work"""
+    assert "1024" in tool_manager.calculate("2**10")
+    assert "error" not in tool_manager.calculate("1.5**100").lower()
+
 def test_calculator_complex_expression(tool_manager):
     """Test calculator with complex expressions"""
     result = tool_manager.calculate("(10 + 5) * 2 / 3")
     
     assert "10" in result  # Should equal 10.0
 
+@pytest.mark.xdist_group("reminders")
 def test_reminder_tool(tool_manager):
     """Test setting reminders"""
     user_id = "test_user_reminder"
@@ -56,6 +77,7 @@ def test_reminder_tool(tool_manager):
     assert len(reminders) > 0
     assert "tomatoes" in reminders[0]['schedule'].lower()
 
+@pytest.mark.xdist_group("reminders")
 def test_multiple_reminders_per_user(tool_manager):
     """Test multiple reminders for one user"""
     user_id = "test_multi_reminder"
@@ -66,19 +88,15 @@ def test_multiple_reminders_per_user(tool_manager):
     reminders = tool_manager.get_user_reminders(user_id)
     assert len(reminders) >= 2
 
-def test_weather_tool_without_api_key(tool_manager):
+def test_weather_tool_without_api_key(temp_reminder_file, monkeypatch):
     """Test weather tool without API key"""
-    # Clear API key temporarily
-    old_key = os.environ.get('WEATHER_API_KEY')
-    os.environ['WEATHER_API_KEY'] = ''
+    # Clear API key for this test (settings are read when the ToolManager is built)
+    monkeypatch.setenv('WEATHER_API_KEY', '')
+    tool_manager = ToolManager()
     
     result = tool_manager.get_weather("New York")
     
     assert "not configured" in result.lower() or "error" in result.lower()
-    
-    # Restore
-    if old_key:
-        os.environ['WEATHER_API_KEY'] = old_key
 
 def test_tool_execution(tool_manager):
     """Test execute_tool dispatcher"""
@@ -100,13 +118,228 @@ def test_tools_description(tool_manager):
     assert "calculator" in description.lower()
     assert "reminder" in description.lower()
 
-def test_search_tool_disabled(tool_manager):
+def test_search_tool_disabled(temp_reminder_file, monkeypatch):
     """Test search tool when disabled"""
-    os.environ['DUCKDUCKGO_SEARCH_ENABLED'] = 'false'
+    monkeypatch.setenv('DUCKDUCKGO_SEARCH_ENABLED', 'false')
+    tool_manager = ToolManager()
     
     result = tool_manager.search_web("test query")
     
     assert "not enabled" in result.lower() or "disabled" in result.lower()
 
+def _reminder_manager(tmp_path, monkeypatch, content=b""):
+    """ToolManager on its own reminder file, pre-filled with content"""
+    path = tmp_path / "reminders.jsonl"
+    path.write_bytes(content)
+    monkeypatch.setenv('REMINDER_FILE', str(path))
+    return ToolManager(), path
+
+def test_legacy_reminder_file_migrated(tmp_path, monkeypatch):
+    """Test the old {user_id: [...]} JSON file is loaded and rewritten as JSON lines"""
+    legacy = {
+        "user_a": [{"schedule": "Water roses daily", "created_at": "2024-05-01T08:00:00", "active": True}],
+        "user_b": [{"schedule": "Mist orchids", "created_at": "2024-05-02T08:00:00", "active": True}],
+    }
+    manager, path = _reminder_manager(tmp_path, monkeypatch, json.dumps(legacy, indent=2).encode())
+    
+    assert manager.get_user_reminders("user_a") == legacy["user_a"]
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(r["user_id"], r["schedule"]) for r in records] == [
+        ("user_a", "Water roses daily"), ("user_b", "Mist orchids")
+    ]
+
+def test_old_default_reminder_file_migrated(tmp_path, monkeypatch):
+    """Test upgrading from reminders.json: reminders are carried over to reminders.jsonl"""
+    legacy = {"user_a": [{"schedule": "Water roses daily", "created_at": "2024-05-01T08:00:00", "active": True}]}
+    (tmp_path / "reminders.json").write_text(json.dumps(legacy))
+    path = tmp_path / "reminders.jsonl"
+    monkeypatch.setenv('REMINDER_FILE', str(path))
+    
+    manager = ToolManager()
+    
+    assert manager.get_user_reminders("user_a") == legacy["user_a"]
+    assert json.loads(path.read_text())["user_id"] == "user_a"
+    # A restart reads the migrated file, not the old one again
+    manager.set_reminder("Mist orchids", "user_a")
+    assert len(ToolManager().get_user_reminders("user_a")) == 2
+
+def test_corrupt_reminder_line_skipped(tmp_path, monkeypatch):
+    """Test a torn trailing line is dropped and new reminders start on a clean line"""
+    good = json.dumps({"user_id": "user_a", "schedule": "Water roses daily", "active": True})
+    manager, path = _reminder_manager(
+        tmp_path, monkeypatch, (good + '\n{"user_id": "user_a", "sched').encode()
+    )
+    
+    assert [r["schedule"] for r in manager.get_user_reminders("user_a")] == ["Water roses daily"]
+    
+    manager.set_reminder("Fertilize monthly", "user_a")
+    reloaded = ToolManager()
+    assert [r["schedule"] for r in reloaded.get_user_reminders("user_a")] == [
+        "Water roses daily", "Fertilize monthly"
+    ]
+
+def test_concurrent_reminder_writers(tmp_path, monkeypatch):
+    """Test two managers sharing a file lose no reminders, including across a clear"""
+    writer_a, _ = _reminder_manager(tmp_path, monkeypatch)
+    writer_b = ToolManager()
+    
+    def add_a():
+        for i in range(200):
+            writer_a.set_reminder(f"Water plant {i}", "user_a")
+    
+    def add_and_clear_b():
+        # Each clear rewrites the file while user_a's appends keep arriving
+        for i in range(200):
+            writer_b.set_reminder(f"Mist plant {i}", "user_b")
+            writer_b.clear_user_reminders("user_b")
+    
+    threads = [threading.Thread(target=add_a), threading.Thread(target=add_and_clear_b)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    
+    reloaded = ToolManager()
+    assert len(reloaded.get_user_reminders("user_a")) == 200
+    assert reloaded.get_user_reminders("user_b") == []
+
+def test_buffered_reminders_visible_before_flush(tmp_path, monkeypatch):
+    """Test buffered reminders are readable at once and only reach the file on flush()"""
+    monkeypatch.setenv('REMINDER_FLUSH_SIZE', '10')
+    manager, path = _reminder_manager(tmp_path, monkeypatch)
+    
+    manager.set_reminder("Water roses daily", "user_a")
+    manager.set_reminder("Mist orchids", "user_a")
+    
+    assert len(manager.get_user_reminders("user_a")) == 2
+    assert path.read_text() == ""
+    
+    manager.flush()
+    assert len(path.read_text().splitlines()) == 2
+
+def test_agent_cleanup_writes_buffered_reminders(offline_agent, tmp_path):
+    """Test agent cleanup writes reminders still waiting in the buffer"""
+    offline_agent.tool_manager.reminder_flush_size = 10
+    offline_agent.tool_manager.set_reminder("Water roses daily", "user_a")
+    path = tmp_path / "reminders.jsonl"
+    assert not path.exists() or path.read_text() == ""
+    
+    offline_agent.cleanup()
+    assert len(path.read_text().splitlines()) == 1
+
+def test_discarded_manager_not_kept_alive(tmp_path, monkeypatch):
+    """Test the exit-time flush hook doesn't keep ToolManagers alive"""
+    manager, _ = _reminder_manager(tmp_path, monkeypatch)
+    ref = weakref.ref(manager)
+    del manager
+    gc.collect()
+    assert ref() is None
+
+def _weather_data(condition_id=800, temp=20, humidity=60):
+    """Minimal OpenWeatherMap response"""
+    return {
+        "main": {"temp": temp, "feels_like": temp, "humidity": humidity},
+        "weather": [{"id": condition_id, "description": "test sky"}],
+        "wind": {"speed": 3},
+    }
+
+class FakeWeatherHTTP:
+    """Stands in for the async HTTP client, counting requests"""
+
+    def __init__(self, data):
+        self.data = data
+        self.calls = 0
+
+    async def get(self, url, params=None):
+        self.calls += 1
+        response = MagicMock()
+        response.json.return_value = self.data
+        return response
+
+@pytest.fixture
+def weather_manager(tool_manager, monkeypatch):
+    """tool_manager with an API key and a fake HTTP client"""
+    http = FakeWeatherHTTP(_weather_data())
+    monkeypatch.setattr(tool_manager, 'weather_api_key', 'test-key')
+    monkeypatch.setattr(tool_manager, '_get_http', lambda: http)
+    monkeypatch.setattr(tool_manager, '_weather_cache', TTLCache(maxsize=512, ttl=600))
+    return tool_manager, http
+
+def test_weather_cached_within_ttl(weather_manager, monkeypatch):
+    """Test a repeat request within the TTL skips HTTP and an expired one refetches"""
+    manager, http = weather_manager
+    now = [0.0]
+    monkeypatch.setattr(manager, '_weather_cache', TTLCache(maxsize=512, ttl=600, timer=lambda: now[0]))
+    
+    first = asyncio.run(manager.aget_weather("Paris"))
+    assert asyncio.run(manager.aget_weather(" paris ")) == first
+    assert http.calls == 1
+    
+    now[0] = 601
+    asyncio.run(manager.aget_weather("Paris"))
+    assert http.calls == 2
+
+def test_weather_non_json_response(weather_manager):
+    """Test a non-JSON body is reported like any other API error (and not cached)"""
+    manager, http = weather_manager
+    
+    class BrokenResponse:
+        def raise_for_status(self):
+            pass
+        
+        def json(self):
+            return json.loads("<html>Bad gateway</html>")
+    
+    async def get(url, params=None):
+        http.calls += 1
+        return BrokenResponse()
+    
+    http.get = get
+    assert asyncio.run(manager.aget_weather("Paris")) == "Unable to retrieve weather for 'Paris'."
+    asyncio.run(manager.aget_weather("Paris"))
+    assert http.calls == 2
+
+@pytest.mark.parametrize("condition_id, rain", [
+    (500, True),   # rain
+    (301, True),   # drizzle
+    (211, True),   # thunderstorm
+    (800, False),  # clear sky
+])
+def test_rain_detected_by_condition_id(weather_manager, condition_id, rain):
+    """Test the watering advice follows the OpenWeatherMap condition group"""
+    manager, http = weather_manager
+    http.data = _weather_data(condition_id=condition_id)
+    
+    result = asyncio.run(manager.aget_weather(f"City {condition_id}"))
+    assert ("Rain expected" in result) is rain
+
+def test_http_client_replaced_and_closed(tool_manager):
+    """Test the async client from a previous loop is closed when a new loop takes over"""
+    old_loop = asyncio.new_event_loop()
+    try:
+        async def get_client():
+            return tool_manager._get_http()
+        
+        old_client = old_loop.run_until_complete(get_client())
+        new_client = asyncio.run(get_client())
+        assert new_client is not old_client
+        assert old_client.is_closed
+    finally:
+        old_loop.close()
+    
+    # The current client was created on asyncio.run's (now closed) loop: dropped, not closed
+    tool_manager.cleanup()
+    assert tool_manager._http is None
+
+def test_cleanup_closes_http_client_inside_loop(tool_manager):
+    """Test cleanup() called from the client's own loop closes it"""
+    async def run():
+        client = tool_manager._get_http()
+        tool_manager.cleanup()
+        await asyncio.sleep(0)
+        return client
+    
+    assert asyncio.run(run()).is_closed
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
\ No newline at end of file